@@ -1,26 +1,88 @@
-import re
 from abc import ABCMeta, abstractmethod
-from struct import pack, unpack
+from functools import lru_cache
+from json import JSONEncoder
 
 # noinspection PyProtectedMember
 from graphenebase import PublicKey as GraphenePublicKey
 
-from utils import Buffer
+from utils import Buffer, Writer, float64
+
+# compact json text, as written one value per line by dump_json()
+json_encode = JSONEncoder(separators=(",", ":")).encode
+
+# values decoded from the wire are already of the right types, unpack() creates them without running __init__
+new = object.__new__
+
+
+# Objects and containers can be changed in place, each one points to the value it is nested in through _owner so a
+# change reaches the objects above it which kept their encoding. Other values are replaced, never changed, and may
+# be shared, so they have no owner.
+
+def owner_setter(type_):
+    # function(value, owner) storing the owner of a value of type_, None when its values have none
+    slot = getattr(type_, "_owner", None)
+    return slot.__set__ if slot is not None else None
+
+
+def adopt(owner, value):
+    if hasattr(type(value), "_owner"):
+        object.__setattr__(value, "_owner", owner)
+
+
+def changed(value):
+    # value and everything it is nested in drop the encodings they kept
+    while value is not None:
+        drop_encoding = getattr(value, "drop_encoding", None)
+        if drop_encoding is not None:
+            drop_encoding()
+        value = getattr(value, "_owner", None)
 
 
 class Serializable(metaclass=ABCMeta):
 
+    __slots__ = ()
+
+    # encoded size of fixed-width types
+    size = None
+
     @staticmethod
     @abstractmethod
     def unpack(msg: Buffer):
         pass
 
+    # decodes bytes which were checked before, e.g. read back from our own block store, without validating the values
+    # again. Types which have nothing to check decode the same way as with unpack().
+    @classmethod
+    def unpack_trusted(cls, msg: Buffer):
+        return cls.unpack(msg)
+
+    # moves past one encoded value without building it
+    @classmethod
+    def skip(cls, msg: Buffer):
+        if cls.size is not None:
+            msg.skip(cls.size)
+        else:
+            cls.unpack(msg)
+
+    # values are encoded by pack_into(), pack() wraps it for a standalone encoding
     @abstractmethod
-    def pack(self):
+    def pack_into(self, writer: Writer):
         pass
 
+    def pack(self):
+        writer = Writer()
+        self.pack_into(writer)
+        return writer
+
+    # encodes a value declared as this type, see FullObjectID
+    @classmethod
+    def pack_value_into(cls, value, writer: Writer):
+        value.pack_into(writer)
+
 class JSONSerializable(metaclass=ABCMeta):
 
+    __slots__ = ()
+
     # @staticmethod
     # @abstractmethod
     # def json_deserialize(msg: any):
@@ -32,9 +94,39 @@ class JSONSerializable(metaclass=ABCMeta):
     def json_object(self):
         pass
 
+    # decodes one value and appends its json text to out, a list of strings. Types on the hot path of block exports
+    # write the text straight from the bytes instead of building the value and its json_object() first.
+    @classmethod
+    def dump_json(cls, msg: Buffer, out: list):
+        out.append(json_encode(cls.unpack(msg).json_object()))
+
 # Basic types
 
+class DataValue:
+    # Values equal when their data is, so they can be dict keys and set members. They only hold data, decoded values
+    # may be shared and data is never changed once set.
+
+    __slots__ = ()
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.data == other.data
+
+    def __hash__(self):
+        return hash(self.data)
+
+    # value built without the checks of __init__, for data known to be valid
+    @classmethod
+    def of(cls, data):
+        res = new(cls)
+        res.data = data
+        return res
+
 class VarInt(Serializable, JSONSerializable):
+
+    __slots__ = ("data",)
+
     def __init__(self, data):
         if type(data) is not int:
             raise TypeError("Unsupported type %s, expected int" % type(data).__name__)
@@ -42,30 +134,18 @@ class VarInt(Serializable, JSONSerializable):
             raise ValueError("Value does not fit in uint64")
         self.data = data
 
+    # decoding and encoding are done by the offset based functions in utils
+
     @staticmethod
     def unpack(msg: Buffer):
-        value = 0
-        i = 0
-        while True:
-            byte = ord(msg.read(1))
-            value += (byte & 0x7f) << (i * 7)
-            if byte & 0x80 != 0x80:
-                break
-            i += 1
-        return value
+        return msg.read_varint()
 
-    def pack(self):
-        res = bytearray()
-        data = self.data
-        while True:
-            v = data & 0x7f
-            if data - 128 > 0:
-                v |= 0x80
-            res.append(v)
-            data >>= 7
-            if data == 0:
-                break
-        return res
+    @staticmethod
+    def skip(msg: Buffer):
+        msg.read_varint()
+
+    def pack_into(self, writer: Writer):
+        writer.write_varint(self.data)
 
     def __repr__(self):
         return str(self.data)
@@ -73,7 +153,10 @@ class VarInt(Serializable, JSONSerializable):
     def json_object(self):
         return self.data
 
-class String(Serializable, JSONSerializable):
+class String(DataValue, Serializable, JSONSerializable):
+
+    __slots__ = ("data",)
+
     def __init__(self, data):
         if type(data) is not str:
             raise TypeError("Unsupported type %s, expected str" % type(data).__name__)
@@ -81,13 +164,22 @@ class String(Serializable, JSONSerializable):
 
     @staticmethod
     def unpack(msg: Buffer):
-        length = VarInt.unpack(msg)
-        return String((msg.read(length)).decode("utf8"))
+        length = msg.read_varint()
+        return String(str(msg.read(length), "utf8"))
 
-    def pack(self):
-        res = VarInt(len(self.data)).pack()
-        res.extend(self.data.encode("utf8"))
-        return res
+    @staticmethod
+    def unpack_trusted(msg: Buffer):
+        length = msg.read_varint()
+        return String.of(str(msg.read(length), "utf8"))
+
+    @staticmethod
+    def skip(msg: Buffer):
+        msg.skip(msg.read_varint())
+
+    def pack_into(self, writer: Writer):
+        data = self.data.encode("utf8")
+        writer.write_varint(len(data))
+        writer.write(data)
 
     def __repr__(self):
         return self.data
@@ -95,8 +187,11 @@ class String(Serializable, JSONSerializable):
     def json_object(self):
         return self.data
 
-class Data(Serializable, JSONSerializable):
+class Data(DataValue, Serializable, JSONSerializable):
     # maps to c++ vector<char> as this type have special json serialization
+
+    __slots__ = ("data",)
+
     def __init__(self, data):
         if type(data) is bytes:
             self.data = data
@@ -107,12 +202,21 @@ class Data(Serializable, JSONSerializable):
 
     @staticmethod
     def unpack(msg: Buffer):
-        length = VarInt.unpack(msg)
-        return Data(msg.read(length))
+        length = msg.read_varint()
+        return Data(msg.read(length).tobytes())
 
-    def pack(self):
-        # TODO: implement
-        raise NotImplementedError
+    @staticmethod
+    def unpack_trusted(msg: Buffer):
+        length = msg.read_varint()
+        return Data.of(msg.read(length).tobytes())
+
+    @staticmethod
+    def skip(msg: Buffer):
+        msg.skip(msg.read_varint())
+
+    def pack_into(self, writer: Writer):
+        writer.write_varint(len(self.data))
+        writer.write(self.data)
 
     def __repr__(self):
         return self.data.hex()
@@ -120,7 +224,11 @@ class Data(Serializable, JSONSerializable):
     def json_object(self):
         return self.data.hex()
 
-class Bool(Serializable, JSONSerializable):
+class Bool(DataValue, Serializable, JSONSerializable):
+
+    __slots__ = ("data",)
+    size = 1
+
     def __init__(self, data):
         if type(data) is not bool:
             raise TypeError("Unsupported type %s, expected bool" % type(data).__name__)
@@ -128,10 +236,14 @@ class Bool(Serializable, JSONSerializable):
 
     @staticmethod
     def unpack(msg: Buffer):
-        return Bool(True) if ord(msg.read(1)) == True else Bool(False)
+        return Bool(True) if msg.read_uint8() == 1 else Bool(False)
 
-    def pack(self):
-        return bytearray([1 if self.data else 0])
+    @staticmethod
+    def unpack_trusted(msg: Buffer):
+        return Bool.of(msg.read_uint8() == 1)
+
+    def pack_into(self, writer: Writer):
+        writer.write_uint8(1 if self.data else 0)
 
     def __repr__(self):
         return "True" if self.data else "False"
@@ -140,7 +252,11 @@ class Bool(Serializable, JSONSerializable):
         return True if self.data else False
 
 
-class Uint8(Serializable, JSONSerializable):
+class Uint8(DataValue, Serializable, JSONSerializable):
+
+    __slots__ = ("data",)
+    size = 1
+
     def __init__(self, data):
         if type(data) is not int:
             raise TypeError("Unsupported type %s, expected int" % type(data).__name__)
@@ -150,10 +266,14 @@ class Uint8(Serializable, JSONSerializable):
 
     @staticmethod
     def unpack(msg: Buffer):
-        return Uint8(ord(msg.read(1)))
+        return Uint8(msg.read_uint8())
 
-    def pack(self):
-        return bytearray([self.data])
+    @staticmethod
+    def unpack_trusted(msg: Buffer):
+        return Uint8.of(msg.read_uint8())
+
+    def pack_into(self, writer: Writer):
+        writer.write_uint8(self.data)
 
     def __repr__(self):
         return str(self.data)
@@ -161,7 +281,11 @@ class Uint8(Serializable, JSONSerializable):
     def json_object(self):
         return self.data
 
-class Uint16(Serializable, JSONSerializable):
+class Uint16(DataValue, Serializable, JSONSerializable):
+
+    __slots__ = ("data",)
+    size = 2
+
     def __init__(self, data):
         if type(data) is not int:
             raise TypeError("Unsupported type %s, expected int" % type(data).__name__)
@@ -171,10 +295,14 @@ class Uint16(Serializable, JSONSerializable):
 
     @staticmethod
     def unpack(msg: Buffer):
-        return Uint16(unpack("<H", msg.read(2))[0])
+        return Uint16(msg.read_uint16())
 
-    def pack(self):
-        return pack("<H", self.data)
+    @staticmethod
+    def unpack_trusted(msg: Buffer):
+        return Uint16.of(msg.read_uint16())
+
+    def pack_into(self, writer: Writer):
+        writer.write_uint16(self.data)
 
     def __repr__(self):
         return str(self.data)
@@ -182,7 +310,11 @@ class Uint16(Serializable, JSONSerializable):
     def json_object(self):
         return self.data
 
-class Uint32(Serializable, JSONSerializable):
+class Uint32(DataValue, Serializable, JSONSerializable):
+
+    __slots__ = ("data",)
+    size = 4
+
     def __init__(self, data):
         if type(data) is not int:
             raise TypeError("Unsupported type %s, expected int" % type(data).__name__)
@@ -192,10 +324,14 @@ class Uint32(Serializable, JSONSerializable):
 
     @staticmethod
     def unpack(msg: Buffer):
-        return Uint32(unpack("<I", msg.read(4))[0])
+        return Uint32(msg.read_uint32())
 
-    def pack(self):
-        return pack("<I", self.data)
+    @staticmethod
+    def unpack_trusted(msg: Buffer):
+        return Uint32.of(msg.read_uint32())
+
+    def pack_into(self, writer: Writer):
+        writer.write_uint32(self.data)
 
     def __repr__(self):
         return str(self.data)
@@ -203,7 +339,11 @@ class Uint32(Serializable, JSONSerializable):
     def json_object(self):
         return self.data
 
-class Uint64(Serializable, JSONSerializable):
+class Uint64(DataValue, Serializable, JSONSerializable):
+
+    __slots__ = ("data",)
+    size = 8
+
     def __init__(self, data):
         if type(data) is not int:
             raise TypeError("Unsupported type %s, expected int" % type(data).__name__)
@@ -213,10 +353,14 @@ class Uint64(Serializable, JSONSerializable):
 
     @staticmethod
     def unpack(msg: Buffer):
-        return Uint64(unpack("<Q", msg.read(8))[0])
+        return Uint64(msg.read_uint64())
 
-    def pack(self):
-        return pack("<Q", self.data)
+    @staticmethod
+    def unpack_trusted(msg: Buffer):
+        return Uint64.of(msg.read_uint64())
+
+    def pack_into(self, writer: Writer):
+        writer.write_uint64(self.data)
 
     def __repr__(self):
         return str(self.data)
@@ -224,7 +368,11 @@ class Uint64(Serializable, JSONSerializable):
     def json_object(self):
         return self.data
 
-class Int64(Serializable, JSONSerializable):
+class Int64(DataValue, Serializable, JSONSerializable):
+
+    __slots__ = ("data",)
+    size = 8
+
     def __init__(self, data):
         if type(data) is not int:
             raise TypeError("Unsupported type %s, expected int" % type(data).__name__)
@@ -234,10 +382,14 @@ class Int64(Serializable, JSONSerializable):
 
     @staticmethod
     def unpack(msg: Buffer):
-        return Int64(unpack("<q", msg.read(8))[0])
+        return Int64(msg.read_int64())
 
-    def pack(self):
-        return pack("<q", self.data)
+    @staticmethod
+    def unpack_trusted(msg: Buffer):
+        return Int64.of(msg.read_int64())
+
+    def pack_into(self, writer: Writer):
+        writer.write_int64(self.data)
 
     def __repr__(self):
         return str(self.data)
@@ -245,23 +397,50 @@ class Int64(Serializable, JSONSerializable):
     def json_object(self):
         return self.data
 
+def ipv4_address(text: str):
+    # dotted IPv4 address as an int, the first number in the highest byte
+    numbers = text.split(".")
+    if len(numbers) != 4 or not all(0 < len(x) <= 3 and x.isascii() and x.isdigit() and int(x) <= 255
+                                    for x in numbers):
+        raise ValueError("IP address is not valid")
+    return int(numbers[0]) << 24 | int(numbers[1]) << 16 | int(numbers[2]) << 8 | int(numbers[3])
+
+def ipv4_text(address: int):
+    return "%d.%d.%d.%d" % (address >> 24, address >> 16 & 255, address >> 8 & 255, address & 255)
+
 class IPAddress(Serializable, JSONSerializable):
-    # Saved as string internally
+    # Saved as the address in an int, like ipaddress.IPv4Address, the dotted form in data is built when it is read
+
+    __slots__ = ("address",)
+    size = 4
+
     def __init__(self, data):
-        if type(data) is not str:
-            raise TypeError("Unsupported type %s, expected str" % type(data).__name__)
-        if re.match(r"^(?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$", data) is None:
-            raise ValueError("IP address is not valid")
-        self.data = data
+        if type(data) is str:
+            self.address = ipv4_address(data)
+        elif type(data) is int:
+            if not 0 <= data < 1 << 32:
+                raise ValueError("IP address is not valid")
+            self.address = data
+        else:
+            raise TypeError("Unsupported type %s, expected str or int" % type(data).__name__)
+
+    @staticmethod
+    def of(address: int):
+        # decoded values skip the checks
+        res = new(IPAddress)
+        res.address = address
+        return res
 
     @staticmethod
     def unpack(msg: Buffer):
-        data = msg.read(4)
-        return IPAddress("%s.%s.%s.%s" % (data[3], data[2], data[1], data[0]))
+        return IPAddress.of(msg.read_uint32())
 
-    def pack(self):
-        msg = list(map(int, self.data.split(".")))
-        return bytearray([msg[3], msg[2], msg[1], msg[0]])
+    def pack_into(self, writer: Writer):
+        writer.write_uint32(self.address)
+
+    @property
+    def data(self):
+        return ipv4_text(self.address)
 
     def __repr__(self):
         return self.data
@@ -270,31 +449,51 @@ class IPAddress(Serializable, JSONSerializable):
         return self.data
 
 class IPEndpoint(Serializable, JSONSerializable):
-    # Saved as string internally
+    # Saved as the address and the port in ints, the "address:port" form in data is built when it is read
+
+    __slots__ = ("address", "port")
+    size = 6
+
     def __init__(self, data):
-        if type(data) is not str:
-            raise TypeError("Unsupported type %s, expected str" % type(data).__name__)
-        if re.match(r"^(?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?):\d+", data) is None:
-            raise ValueError("IP endpoint is not valid")
-        try:
-            port = int(data.split(":")[1])
-        except ValueError:
-            raise ValueError("Port is not valid")
+        if type(data) is str:
+            address, separator, port = data.partition(":")
+            if not separator:
+                raise ValueError("IP endpoint is not valid")
+            self.address = ipv4_address(address)
+        elif type(data) is tuple and len(data) == 2:
+            address, port = data
+            self.address = IPAddress(address).address
+        else:
+            raise TypeError("Unsupported type %s, expected str or (address, port) tuple" % type(data).__name__)
+        if type(port) is str:
+            if not port.isascii() or not port.isdigit():
+                raise ValueError("Port is not valid")
+            port = int(port)
+        elif type(port) is not int:
+            raise TypeError("Unsupported port type %s, expected str or int" % type(port).__name__)
         if port <= 0 or port > 65535:
             raise ValueError("Port is not valid")
+        self.port = port
 
-        self.data = data
+    @staticmethod
+    def of(address: int, port: int):
+        # decoded values skip the checks
+        res = new(IPEndpoint)
+        res.address = address
+        res.port = port
+        return res
 
     @staticmethod
     def unpack(msg: Buffer):
-        data = msg.read(6)
-        return IPEndpoint("%s.%s.%s.%s:%s" % (data[3], data[2], data[1], data[0], unpack("<H", data[4:6])[0]))
+        return IPEndpoint.of(msg.read_uint32(), msg.read_uint16())
 
-    def pack(self):
-        msg = list(map(int, re.split(r"[:.]", self.data)))
-        res = bytearray([msg[3], msg[2], msg[1], msg[0]])
-        res.extend(pack("<H", msg[4]))
-        return res
+    def pack_into(self, writer: Writer):
+        writer.write_uint32(self.address)
+        writer.write_uint16(self.port)
+
+    @property
+    def data(self):
+        return "%s:%d" % (ipv4_text(self.address), self.port)
 
     def __repr__(self):
         return self.data
@@ -302,8 +501,12 @@ class IPEndpoint(Serializable, JSONSerializable):
     def json_object(self):
         return self.data
 
-class FakePublicKey(Serializable, JSONSerializable):
+class FakePublicKey(DataValue, Serializable, JSONSerializable):
     # for node_ids which is actually random 33 bytes
+
+    __slots__ = ("data",)
+    size = 33
+
     def __init__(self, data):
         if type(data) is bytes:
             self.data = data
@@ -314,10 +517,14 @@ class FakePublicKey(Serializable, JSONSerializable):
 
     @staticmethod
     def unpack(msg: Buffer):
-        return FakePublicKey(msg.read(33))
+        return FakePublicKey(msg.read(33).tobytes())
 
-    def pack(self):
-        return bytearray(self.data)
+    @staticmethod
+    def unpack_trusted(msg: Buffer):
+        return FakePublicKey.of(msg.read(33).tobytes())
+
+    def pack_into(self, writer: Writer):
+        writer.write(self.data)
 
     def __repr__(self):
         return self.data.hex()
@@ -326,29 +533,64 @@ class FakePublicKey(Serializable, JSONSerializable):
         return self.data.hex()
 
 class PublicKey(Serializable, JSONSerializable):
-    # wraps around graphenebase pubkey
+    # Keeps the 33 bytes of the compressed key, the graphenebase pubkey in data and the BTS text of json_object() are
+    # built the first time they are used. Values are never changed, decoding shares one value per key among the most
+    # recently decoded ones.
+
+    __slots__ = ("raw", "key", "text")
+    size = 33
+
     def __init__(self, data):
         if type(data) is GraphenePublicKey:
-            self.data = data
+            self.raw = bytes(data)
+            self.key = data
+        elif type(data) is bytes and len(data) == 33:
+            self.raw = data
+            self.key = None
         else:
-            raise TypeError("Unsupported type %s, expected graphenebase PublicKey" % type(data).__name__)
+            raise TypeError("Unsupported type %s, expected graphenebase PublicKey or 33 bytes" % type(data).__name__)
+        self.text = None
 
     @staticmethod
     def unpack(msg: Buffer):
-        data = msg.read(33)
-        return PublicKey(GraphenePublicKey(data.hex(), prefix="BTS"))
+        return PublicKey.intern(msg.read(33).tobytes())
 
-    def pack(self):
-        return bytearray(bytes(self.data))
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def intern(raw: bytes):
+        return PublicKey(raw)
+
+    @property
+    def data(self):
+        res = self.key
+        if res is None:
+            res = self.key = GraphenePublicKey(self.raw.hex(), prefix="BTS")
+        return res
+
+    def pack_into(self, writer: Writer):
+        writer.write(self.raw)
+
+    def __getstate__(self):
+        return {"raw": self.raw}
+
+    def __setstate__(self, state):
+        self.__init__(state["raw"])
 
     def __repr__(self):
-        return repr(self.data)
+        return self.raw.hex()
 
     def json_object(self):
-        return str(self.data)
+        res = self.text
+        if res is None:
+            res = self.text = str(self.data)
+        return res
 
-class Signature(Serializable, JSONSerializable):
+class Signature(DataValue, Serializable, JSONSerializable):
     # save as bytes
+
+    __slots__ = ("data",)
+    size = 65
+
     def __init__(self, data):
         if type(data) is bytes:
             self.data = data
@@ -359,10 +601,14 @@ class Signature(Serializable, JSONSerializable):
 
     @staticmethod
     def unpack(msg: Buffer):
-        return Signature(msg.read(65))
+        return Signature(msg.read(65).tobytes())
 
-    def pack(self):
-        return self.data
+    @staticmethod
+    def unpack_trusted(msg: Buffer):
+        return Signature.of(msg.read(65).tobytes())
+
+    def pack_into(self, writer: Writer):
+        writer.write(self.data)
 
     def __repr__(self):
         return self.data.hex()
@@ -370,7 +616,10 @@ class Signature(Serializable, JSONSerializable):
     def json_object(self):
         return self.data.hex()
 
-class SHA1(Serializable, JSONSerializable):
+class SHA1(DataValue, Serializable, JSONSerializable):
+
+    __slots__ = ("data",)
+    size = 20
 
     def __init__(self, data):
         if type(data) is bytes:
@@ -382,10 +631,14 @@ class SHA1(Serializable, JSONSerializable):
 
     @staticmethod
     def unpack(msg: Buffer):
-        return SHA1(msg.read(20))
+        return SHA1(msg.read(20).tobytes())
 
-    def pack(self):
-        return self.data
+    @staticmethod
+    def unpack_trusted(msg: Buffer):
+        return SHA1.of(msg.read(20).tobytes())
+
+    def pack_into(self, writer: Writer):
+        writer.write(self.data)
 
     def __repr__(self):
         return self.data.hex()
@@ -393,7 +646,10 @@ class SHA1(Serializable, JSONSerializable):
     def json_object(self):
         return self.data.hex()
 
-class SHA256(Serializable, JSONSerializable):
+class SHA256(DataValue, Serializable, JSONSerializable):
+
+    __slots__ = ("data",)
+    size = 32
 
     def __init__(self, data):
         if type(data) is bytes:
@@ -405,10 +661,14 @@ class SHA256(Serializable, JSONSerializable):
 
     @staticmethod
     def unpack(msg: Buffer):
-        return SHA256(msg.read(32))
+        return SHA256(msg.read(32).tobytes())
 
-    def pack(self):
-        return self.data
+    @staticmethod
+    def unpack_trusted(msg: Buffer):
+        return SHA256.of(msg.read(32).tobytes())
+
+    def pack_into(self, writer: Writer):
+        writer.write(self.data)
 
     def __repr__(self):
         return self.data.hex()
@@ -416,8 +676,12 @@ class SHA256(Serializable, JSONSerializable):
     def json_object(self):
         return self.data.hex()
     
-class RIPEMD160(Serializable, JSONSerializable):
+class RIPEMD160(DataValue, Serializable, JSONSerializable):
     # only used as item id and address
+
+    __slots__ = ("data",)
+    size = 20
+
     def __init__(self, data):
         if type(data) is bytes:
             self.data = data
@@ -430,10 +694,14 @@ class RIPEMD160(Serializable, JSONSerializable):
 
     @staticmethod
     def unpack(msg: Buffer):
-        return RIPEMD160(msg.read(20))
+        return RIPEMD160(msg.read(20).tobytes())
 
-    def pack(self):
-        return self.data
+    @staticmethod
+    def unpack_trusted(msg: Buffer):
+        return RIPEMD160.of(msg.read(20).tobytes())
+
+    def pack_into(self, writer: Writer):
+        writer.write(self.data)
 
     def __repr__(self):
         return self.data.hex()
@@ -443,6 +711,9 @@ class RIPEMD160(Serializable, JSONSerializable):
 
 class VoteID(Serializable, JSONSerializable):
 
+    __slots__ = ("type", "instance")
+    size = 4
+
     def __init__(self, *args):
         if len(args) == 1:
             if type(args[0]) is str:
@@ -460,14 +731,13 @@ class VoteID(Serializable, JSONSerializable):
 
     @staticmethod
     def unpack(msg: Buffer):
-        value = unpack("<I", msg.read(4))[0]
+        value = msg.read_uint32()
         type_ = value & 0xff
         instance = (value & 0xffffff00) >> 8
         return VoteID(type_, instance)
 
-    def pack(self):
-        # TODO: implement
-        raise NotImplementedError
+    def pack_into(self, writer: Writer):
+        writer.write_uint32(self.type & 0xff | self.instance << 8)
 
     def __repr__(self):
         return "%d:%d" % (self.type, self.instance)
@@ -478,35 +748,41 @@ class VoteID(Serializable, JSONSerializable):
 
 class VariantObject(Serializable, JSONSerializable):
     # dict string:any, enforce string
+
+    __slots__ = ("data",)
+
     def __init__(self, data: dict):
         if type(data) is not dict:
             raise TypeError("Unsupported type %s, expected dict" % type(data).__name__)
         if not all(type(x) is str or type(x) is String for x in data.keys()):
             raise TypeError("Keys must be str")
-        if not all(type(y) in Variant.allowed_types for y in data.values()):
+        if not all(type(y) in Variant.allowed_types or type(y) is Variant for y in data.values()):
             raise TypeError("Values must be able to be converted to Variant")
         self.data = {}
         for key, value in data.items():
-            self.data[key] = Variant(value)
+            self.data[key] = value if type(value) is Variant else Variant(value)
 
     @staticmethod
     def unpack(msg: Buffer):
         obj = {}
-        count = VarInt.unpack(msg)
+        count = msg.read_varint()
         for _ in range(count):
             key = String.unpack(msg).data
-            index = ord(msg.read(1))
-            type_ = Variant.allowed_types[index]
-            value = type_.unpack(msg)
-            obj[key] = value
+            obj[key] = Variant.unpack(msg)
         return VariantObject(obj)
 
-    def pack(self):
-        res = VarInt(len(self.data)).pack()
+    @staticmethod
+    def skip(msg: Buffer):
+        count = msg.read_varint()
+        for _ in range(count):
+            String.skip(msg)
+            Variant.skip(msg)
+
+    def pack_into(self, writer: Writer):
+        writer.write_varint(len(self.data))
         for k, v in self.data.items():
-            res.extend(String(k).pack())
-            res.extend(v.pack())
-        return res
+            String(k).pack_into(writer)
+            v.pack_into(writer)
 
     def __getitem__(self, item):
         return self.data[item]
@@ -514,7 +790,7 @@ class VariantObject(Serializable, JSONSerializable):
     def __setitem__(self, key, value):
         if type(key) is not str:
             raise TypeError("Keys must be str")
-        self.data[key] = value
+        self.data[key] = value if type(value) is Variant else Variant(value)
 
     def __repr__(self):
         return str(self.data)
@@ -524,12 +800,15 @@ class VariantObject(Serializable, JSONSerializable):
 
 class Null(Serializable, JSONSerializable):
 
+    __slots__ = ()
+    size = 0
+
     @staticmethod
     def unpack(_):
         return Null()
 
-    def pack(self):
-        return bytearray()
+    def pack_into(self, writer: Writer):
+        pass
 
     def __repr__(self):
         return "null"
@@ -537,37 +816,92 @@ class Null(Serializable, JSONSerializable):
     def json_object(self):
         return None
 
+class Double(Serializable, JSONSerializable):
+
+    __slots__ = ("data",)
+    size = 8
+
+    def __init__(self, data):
+        if type(data) is not float:
+            raise TypeError("Unsupported type %s, expected float" % type(data).__name__)
+        self.data = data
+
+    @staticmethod
+    def unpack(msg: Buffer):
+        return Double(msg.unpack(float64)[0])
+
+    def pack_into(self, writer: Writer):
+        writer.write_struct(float64, self.data)
+
+    def __repr__(self):
+        return str(self.data)
+
+    def json_object(self):
+        return self.data
+
+class VariantArray(Serializable, JSONSerializable):
+    # list of Variant, the array type of Variant
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: list):
+        if type(data) is not list:
+            raise TypeError("Unsupported type %s, expected list" % type(data).__name__)
+        self.data = [x if type(x) is Variant else Variant(x) for x in data]
+
+    @staticmethod
+    def unpack(msg: Buffer):
+        return VariantArray([Variant.unpack(msg) for _ in range(msg.read_varint())])
+
+    @staticmethod
+    def skip(msg: Buffer):
+        for _ in range(msg.read_varint()):
+            Variant.skip(msg)
+
+    def pack_into(self, writer: Writer):
+        writer.write_varint(len(self.data))
+        for x in self.data:
+            x.pack_into(writer)
+
+    def __repr__(self):
+        return "[" + ", ".join(map(repr, self.data)) + "]"
+
+    def json_object(self):
+        return [x.json_object() for x in self.data]
+
 class Variant(Serializable, JSONSerializable):
 
+    __slots__ = ("data",)
+
+    # indexed by the type tag in front of the value
     allowed_types = [
         Null,
-        Null, # Int64
+        Int64,
         Uint64,
-        Null, # Double
-        Null, # Bool
+        Double,
+        Bool,
         String,
-        Null, # Array
+        VariantArray,
         VariantObject,
-        Null, # Blob
+        Data,  # Blob
     ]
 
     def __init__(self, data):
-        # TODO: array (Vector[Variant]) may need additional logic
         if type(data) not in self.allowed_types:
             raise TypeError("Unsupported type %s for Variant" % type(data))
         self.data = data
 
     @staticmethod
     def unpack(msg: Buffer):
-        # TODO: Legit todo
-        pass
+        return Variant(Variant.allowed_types[msg.read_uint8()].unpack(msg))
 
-    def pack(self):
-        # TODO: array (Vector[Variant]) may need additional logic
-        index = VarInt(self.allowed_types.index(type(self.data)))
-        res = index.pack()
-        res.extend(self.data.pack())
-        return res
+    @staticmethod
+    def skip(msg: Buffer):
+        Variant.allowed_types[msg.read_uint8()].skip(msg)
+
+    def pack_into(self, writer: Writer):
+        writer.write_uint8(self.allowed_types.index(type(self.data)))
+        self.data.pack_into(writer)
 
     def __repr__(self):
         return str(self.data)
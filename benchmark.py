@@ -0,0 +1,950 @@
+import argparse
+import asyncio
+import gc
+import io
+import json
+import logging
+import multiprocessing
+import os
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from struct import pack, unpack
+
+# noinspection PyProtectedMember
+from graphenebase import PublicKey as GraphenePublicKey
+
+import crypto
+from basic_types import (
+    VarInt, Signature, RIPEMD160, Bool, Uint8, Uint16, Uint32, Uint64, Int64, String, Data, FakePublicKey, PublicKey,
+    SHA1, SHA256, VoteID, IPAddress, IPEndpoint, VariantObject, Null, json_encode)
+from columns import operation_columns, numpy
+from connection import PeerProtocol, connect
+from export import export_blocks, export_operations
+from fixtures import block_bytes, operations_block, block_frames, decode_block, mock_chain, block_id
+from generic_types import Vector, Map, Optional, Extension, StaticVariant
+from interest import AccountFilter
+from messages import (
+    time_request_respond, BlockMessage, TrxMessage, FetchItemsMessage, ItemID, block_numbers, frame_body,
+    decode_message, AddressMessage, address_array, block_respond, blockchain_item_id_inventory_respond)
+from objectids import ObjectID, FullObjectID
+from objects import Object
+from operationimpl import (
+    TransferOperation, LimitOrderCreateOperation, AccountCreateOperation,
+    AssetUpdateOperation, ProposalCreateOperation, CommitteeMemberUpdateGlobalParametersOperation, OperationVariant,
+    SignedBlock, OperationSelection)
+from pool import DecodePool
+from sync import BlockSync
+from utils import Buffer, encode_varint_into
+
+
+# Benchmarks are run with `python benchmark.py <name> [<name> ...]`, results are printed as plain text tables.
+
+
+def _mock_peer(port_queue, stop):
+    # answers current time requests on a loopback port, runs in its own process to keep its CPU time separate
+    async def serve():
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(
+            lambda: PeerProtocol(actions={5012: time_request_respond}, server_side=True), "127.0.0.1", 0)
+        port_queue.put(server.sockets[0].getsockname()[1])
+        await loop.run_in_executor(None, stop.wait)
+        server.close()
+    asyncio.run(serve())
+
+
+class _Pinger:
+
+    def __init__(self, count):
+        self.count = count
+        self.latencies = []
+        self.sent = 0
+        self.done = asyncio.get_running_loop().create_future()
+
+    def ping(self, conn):
+        self.sent = time.perf_counter()
+        conn.send(5012, {"request_sent_time": int(time.time() * 1000000)})
+
+    def reply(self, _, conn):
+        self.latencies.append(time.perf_counter() - self.sent)
+        if len(self.latencies) < self.count:
+            self.ping(conn)
+        elif not self.done.done():
+            self.done.set_result(None)
+
+
+def bench_connection(peer_counts=(1, 10, 100), messages=200):
+    port_queue = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    server = multiprocessing.Process(target=_mock_peer, args=(port_queue, stop))
+    server.start()
+    port = port_queue.get()
+
+    async def run(peers):
+        pingers = [_Pinger(messages) for _ in range(peers)]
+        conns = await asyncio.gather(*(
+            connect("127.0.0.1", port, actions={5013: p.reply}) for p in pingers))
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        for p, c in zip(pingers, conns):
+            p.ping(c)
+        await asyncio.gather(*(p.done for p in pingers))
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+        for c in conns:
+            c.close()
+        latencies = sorted(x for p in pingers for x in p.latencies)
+        return latencies, wall, cpu
+
+    print("%6s %10s %10s %10s %12s %8s" % ("peers", "msg/s", "p50 ms", "p99 ms", "cpu us/msg", "cpu %"))
+    try:
+        for peers in peer_counts:
+            latencies, wall, cpu = asyncio.run(run(peers))
+            print("%6d %10.0f %10.3f %10.3f %12.1f %8.1f" % (
+                peers, len(latencies) / wall,
+                statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.99) - 1] * 1000,
+                cpu / len(latencies) * 1000000, cpu / wall * 100
+            ))
+    finally:
+        stop.set()
+        server.join()
+
+
+class _BaselineBuffer(Buffer):
+    # Buffer and VarInt.unpack as they were before the cursor: every read copies the bytes out and deletes them from
+    # the front of the buffer, integers are unpacked from those copies and varints are read one byte per read. The
+    # copies are wrapped in memoryviews as the decoders call tobytes() on what read() returns.
+
+    def __init__(self, data=b""):
+        super().__init__()
+        self._data = bytearray(data)
+
+    def read(self, size: int):
+        data = self._data[:size]
+        self._data[:size] = b""
+        return memoryview(data)
+
+    def peek(self, size: int):
+        return memoryview(self._data[:size])
+
+    def skip(self, size: int):
+        self.read(size)
+
+    def unpack(self, struct):
+        return struct.unpack(self.read(struct.size))
+
+    def read_uint8(self):
+        return self.read(1)[0]
+
+    def read_uint16(self):
+        return unpack("<H", self.read(2))[0]
+
+    def read_uint32(self):
+        return unpack("<I", self.read(4))[0]
+
+    def read_uint64(self):
+        return unpack("<Q", self.read(8))[0]
+
+    def read_int64(self):
+        return unpack("<q", self.read(8))[0]
+
+    def read_varint(self):
+        value = 0
+        i = 0
+        while True:
+            byte = self.read(1)[0]
+            value += (byte & 0x7f) << (i * 7)
+            if byte & 0x80 != 0x80:
+                break
+            i += 1
+        return value
+
+    def read_varints(self, count: int):
+        return [self.read_varint() for _ in range(count)]
+
+    def count(self):
+        return len(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+
+def bench_buffer(sizes=(256 * 1024, 1024 * 1024, 2 * 1024 * 1024), rounds=3):
+    # the rounds alternate between the buffers and the best one of each counts, every decode starts after a collection
+    print("%10s %8s %14s %14s" % ("block", "trx", "baseline ms", "cursor ms"))
+    with raw_not_kept():
+        for size in sizes:
+            data = block_bytes(size)
+            timings = [[], []]
+            for _ in range(rounds):
+                for timing, buffer_type in zip(timings, (_BaselineBuffer, Buffer)):
+                    gc.collect()
+                    start = time.perf_counter()
+                    block = SignedBlock.unpack(buffer_type(data))
+                    timing.append((time.perf_counter() - start) * 1000)
+            baseline, cursor = map(min, timings)
+            print("%10d %8d %14.1f %14.1f" % (len(data), len(block["transactions"].data), baseline, cursor))
+
+
+def bench_lazy(sizes=(256 * 1024, 1024 * 1024, 2 * 1024 * 1024)):
+    print("%10s %8s %12s %12s %14s" % ("block", "trx", "eager ms", "lazy ms", "lazy+touch ms"))
+    for size in sizes:
+        data = block_bytes(size)
+        timings = []
+        start = time.perf_counter()
+        SignedBlock.unpack(Buffer(data))
+        timings.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        block = BlockMessage.unpack(Buffer(data))
+        timings.append((time.perf_counter() - start) * 1000)
+        transactions = block["block"]["transactions"].data
+        for i in range(len(transactions)):
+            transactions[i]
+        timings.append((time.perf_counter() - start) * 1000)
+        print("%10d %8d %12.1f %12.1f %14.1f" % (len(data), len(transactions), *timings))
+
+
+def bench_threads(threads=(1, 2, 4, 8), blocks=32, size=64 * 1024):
+    # decodes the same blocks from several threads at once, test_threads checks the results
+    data = [block_bytes(size, 30000000 + i * 1000) for i in range(blocks)]
+
+    def decode(i):
+        block = BlockMessage.unpack(Buffer(data[i]))
+        # touch the lazy transactions in a different order on every thread
+        for trx in reversed(block["block"]["transactions"].data):
+            trx.json_object()
+        return json.dumps(block.json_object())
+
+    print("%8s %8s %10s" % ("threads", "blocks", "ms"))
+    for count in threads:
+        with ThreadPoolExecutor(count) as pool:
+            start = time.perf_counter()
+            results = list(pool.map(decode, [i % blocks for i in range(blocks * count)]))
+            elapsed = (time.perf_counter() - start) * 1000
+        print("%8d %8d %10.1f" % (count, len(results), elapsed))
+
+
+def bench_handshake(rounds=50):
+    names = [name for name in crypto.backends if name != "coincurve" or crypto.coincurve is not None]
+    message = bytes(64)
+    print("%14s %12s %12s %12s %12s" % ("backend", "keygen us", "ecdh us", "sign us", "recover us"))
+    for name in names:
+        backend = crypto.get_backend(name)
+        secret = backend.new_secret()
+        public_key = backend.public_key(secret)
+        signature = backend.sign_compact(message, secret)
+        timings = []
+        for op, args in (
+                (backend.public_key, (secret,)),
+                (backend.ecdh, (secret, public_key)),
+                (backend.sign_compact, (message, secret)),
+                (backend.recover_compact, (message, signature))):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                op(*args)
+            timings.append((time.perf_counter() - start) / rounds * 1000000)
+        print("%14s %12.0f %12.0f %12.0f %12.0f" % (name, *timings))
+
+    # full loopback handshakes, the mock peer always uses the default backend
+    port_queue = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    server = multiprocessing.Process(target=_mock_peer, args=(port_queue, stop))
+    server.start()
+    port = port_queue.get()
+
+    async def run(backend):
+        for _ in range(rounds):
+            conn = await connect("127.0.0.1", port, backend=backend)
+            conn.close()
+
+    print("%14s %14s %14s" % ("backend", "connect ms", "cpu ms"))
+    try:
+        for name in names:
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            asyncio.run(run(crypto.get_backend(name)))
+            print("%14s %14.2f %14.2f" % (
+                name, (time.perf_counter() - wall) / rounds * 1000, (time.process_time() - cpu) / rounds * 1000))
+    finally:
+        stop.set()
+        server.join()
+
+
+sample_values = {
+    Null: b"",
+    Bool: b"\x01",
+    Uint8: b"\x07",
+    Uint16: pack("<H", 1234),
+    Uint32: pack("<I", 1560000000),
+    Uint64: pack("<Q", 1560000000000000),
+    Int64: pack("<q", -123456789),
+    String: VarInt(11).pack() + b"hello world",
+    Data: VarInt(8).pack() + bytes(range(8)),
+    FakePublicKey: bytes(range(33)),
+    PublicKey: bytes.fromhex("0279be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798"),
+    Signature: bytes([0x1f]) + bytes(range(64)),
+    SHA1: bytes(range(20)),
+    SHA256: bytes(range(32)),
+    RIPEMD160: bytes(range(20)),
+    VoteID: pack("<I", 1 | 23 << 8),
+    IPAddress: bytes([1, 0, 0, 127]),
+    IPEndpoint: bytes([1, 0, 0, 127]) + pack("<H", 1776),
+    VariantObject: VarInt(0).pack(),
+    FullObjectID: pack("<Q", 1 << 56 | 2 << 48 | 42),
+}
+
+
+def sample_bytes(type_, depth=0):
+    # encoding of a made up value for any type in the schemas, containers get one or two elements up to a depth
+    if type_ in sample_values:
+        return sample_values[type_]
+    if issubclass(type_, ObjectID):
+        return VarInt(12345).pack()
+    if issubclass(type_, Object):
+        return b"".join(sample_bytes(t, depth + 1) for t in type_.definition.values())
+    if issubclass(type_, Vector):
+        count = 2 if depth < 4 else 0
+        return VarInt(count).pack() + sample_bytes(type_.types[0], depth + 1) * count
+    if issubclass(type_, Map):
+        return VarInt(1).pack() + sample_bytes(type_.types[0], depth + 1) + sample_bytes(type_.types[1], depth + 1)
+    if issubclass(type_, Optional):
+        return b"\x01" + sample_bytes(type_.types[0], depth + 1) if depth < 4 else b"\x00"
+    if issubclass(type_, Extension):
+        fields = list(type_.types[0].definition.values())
+        res = VarInt(len(fields)).pack()
+        for i, t in enumerate(fields):
+            res += VarInt(i).pack() + sample_bytes(t, depth + 1)
+        return res
+    if issubclass(type_, StaticVariant):
+        index = next(i for i, t in enumerate(type_.types) if t is not type(None))
+        return VarInt(index).pack() + sample_bytes(type_.types[index], depth + 1)
+    raise TypeError("No sample for %s" % type_)
+
+
+@contextmanager
+def interpreted():
+    # runs Object decoding and encoding through the definition loops instead of the compiled codecs
+    unpack_, pack_into_ = Object.__dict__["unpack"], Object.__dict__["pack_into"]
+    Object.unpack, Object.pack_into = Object.__dict__["unpack_interpreted"], Object.__dict__["pack_into_interpreted"]
+    try:
+        yield
+    finally:
+        Object.unpack, Object.pack_into = unpack_, pack_into_
+
+
+@contextmanager
+def raw_not_kept():
+    # decodes without keeping the raw bytes of any object
+    classes = (TrxMessage, BlockMessage)
+    for cls in classes:
+        cls.keep_raw = False
+    try:
+        yield
+    finally:
+        for cls in classes:
+            cls.keep_raw = True
+
+
+def _per_call(f, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        f()
+    return (time.perf_counter() - start) / rounds * 1000000
+
+
+def bench_codec(rounds=200):
+    print("%-48s %6s %12s %12s %12s %12s" % (
+        "operation", "bytes", "unpack us", "compiled us", "pack us", "compiled us"))
+    totals = [0, 0, 0, 0]
+    for op in OperationVariant.types:
+        if op is type(None):
+            continue
+        data = sample_bytes(op)
+        with interpreted():
+            value = op.unpack(Buffer(data))
+            expected = value.json_object()
+            timings = [_per_call(lambda: op.unpack(Buffer(data)), rounds)]
+        compiled = op.unpack(Buffer(data))
+        assert compiled.json_object() == expected, op.__name__
+        timings.append(_per_call(lambda: op.unpack(Buffer(data)), rounds))
+        with interpreted():
+            packed = value.pack()
+            timings.append(_per_call(value.pack, rounds))
+        assert packed == data and value.pack() == packed, op.__name__
+        timings.append(_per_call(value.pack, rounds))
+        totals = [a + b for a, b in zip(totals, timings)]
+        print("%-48s %6d %12.1f %12.1f %12.1f %12.1f" % (op.__name__, len(data), *timings))
+    print("%-48s %6s %12.1f %12.1f %12.1f %12.1f" % ("total", "", *totals))
+
+
+def bench_fixed(counts=(100, 2000, 20000), rounds=20):
+    print("%8s %12s %12s %14s %14s" % ("ids", "list ms", "bulk ms", "numbers ms", "bulk+numpy ms"))
+    for count in counts:
+        data = bytearray()
+        encode_varint_into(data, count)
+        for i in range(count):
+            data += RIPEMD160(pack(">I", 30000000 + i) + bytes(16)).pack()
+        data = bytes(data)
+
+        def item_list():
+            buffer = Buffer(data)
+            return [ItemID.unpack(buffer) for _ in range(buffer.read_varint())]
+
+        items = item_list()
+        bulk = Vector[ItemID].unpack(Buffer(data))
+        assert list(block_numbers(bulk)) == [unpack(">I", x.data[:4])[0] for x in items]
+        print("%8d %12.3f %12.3f %14.3f %14.3f" % (
+            count,
+            _per_call(item_list, rounds) / 1000,
+            _per_call(lambda: Vector[ItemID].unpack(Buffer(data)), rounds) / 1000,
+            _per_call(lambda: [unpack(">I", x.data[:4])[0] for x in items], rounds) / 1000,
+            _per_call(lambda: block_numbers(Vector[ItemID].unpack(Buffer(data))), rounds) / 1000,
+        ))
+
+
+def bench_pack(rounds=20):
+    ids = [pack(">I", 30000000 + i) + bytes(16) for i in range(5000)]
+    fetch = FetchItemsMessage({"item_type": 1001, "items_to_fetch": ids})
+    with raw_not_kept():
+        # encode the values, not the bytes they were decoded from
+        block = SignedBlock.unpack(Buffer(block_bytes(1024 * 1024)))
+    print("%-32s %10s %10s" % ("message", "bytes", "pack ms"))
+    for name, value in (("fetch items, 5000 ids", fetch), ("signed block, 1 MiB", block)):
+        print("%-32s %10d %10.2f" % (name, len(value.pack()), _per_call(value.pack, rounds) / 1000))
+
+
+def bench_relay(sizes=(64 * 1024, 1024 * 1024), rounds=10):
+    # a received block message forwarded as it came in, against encoding it again
+    print("%10s %12s %14s" % ("block", "raw ms", "re-encode ms"))
+    for size in sizes:
+        data = block_bytes(size)
+        message = BlockMessage.unpack(Buffer(data))
+        assert message.pack() == data
+        raw = _per_call(message.pack, rounds) / 1000
+        message.invalidate()
+        assert message.pack() == data
+        print("%10d %12.3f %14.3f" % (len(data), raw, _per_call(message.pack, rounds) / 1000))
+
+
+def _bytewise_varint(self):
+    # VarInt.unpack as it used to be, one read per byte
+    value = 0
+    i = 0
+    while True:
+        byte = self.read_uint8()
+        value += (byte & 0x7f) << (i * 7)
+        if byte & 0x80 != 0x80:
+            break
+        i += 1
+    return value
+
+
+@contextmanager
+def bytewise_varints():
+    read_varint, read_varints = Buffer.read_varint, Buffer.read_varints
+    Buffer.read_varint = _bytewise_varint
+    Buffer.read_varints = lambda self, count: [_bytewise_varint(self) for _ in range(count)]
+    try:
+        yield
+    finally:
+        Buffer.read_varint, Buffer.read_varints = read_varint, read_varints
+
+
+def bench_varint(rounds=5000, operations=8):
+    values = list(range(0, 1 << 28, (1 << 28) // 10000))
+    data = bytearray()
+    for v in values:
+        encode_varint_into(data, v)
+    data = bytes(data)
+    def single():
+        buffer = Buffer(data)
+        for _ in values:
+            buffer.read_varint()
+
+    print("%-48s %12s %12s %12s" % ("decode", "bytewise /s", "single /s", "batch /s"))
+    with bytewise_varints():
+        rates = [len(values) / _per_call(single, 20) * 1000000]
+    rates.append(len(values) / _per_call(single, 20) * 1000000)
+    rates.append(len(values) / _per_call(lambda: Buffer(data).read_varints(len(values)), 20) * 1000000)
+    print("%-48s %12.0f %12.0f %12.0f" % ("%d varints up to 2^28" % len(values), *rates))
+
+    # operations with the most object id fields
+    def object_ids(op):
+        return sum(issubclass(t, ObjectID) for t in op.definition.values())
+    ops = sorted((op for op in OperationVariant.types if op is not type(None)), key=object_ids, reverse=True)
+    print("%-48s %6s %12s %12s" % ("operation", "ids", "bytewise /s", "varint /s"))
+    for op in ops[:operations]:
+        data = sample_bytes(op)
+        with bytewise_varints():
+            before = 1000000 / _per_call(lambda: op.unpack(Buffer(data)), rounds)
+        after = 1000000 / _per_call(lambda: op.unpack(Buffer(data)), rounds)
+        print("%-48s %6d %12.0f %12.0f" % (op.__name__, object_ids(op), before, after))
+
+
+def bench_ids(sizes=(64 * 1024, 1024 * 1024), rounds=5):
+    # first block and transaction ids of a freshly decoded block: hashed from its values encoded again, from the bytes
+    # kept while decoding it and, for a lazy block, from those recorded while skipping its transactions. The last
+    # column asks an eager block again, which returns the ids it remembered.
+    print("%10s %8s %14s %10s %10s %10s" % ("block", "trx", "re-encode ms", "kept ms", "lazy ms", "again ms"))
+    for size in sizes:
+        data = block_bytes(size)
+
+        def ids(block_):
+            return block_.id(), block_.transaction_ids()
+
+        def invalidated():
+            block_ = SignedBlock.unpack(Buffer(data))
+            for trx in block_.transactions.data:
+                trx.invalidate()
+            return block_
+
+        def first(decode):
+            # best time of the first call over freshly decoded blocks, the decoding is not timed
+            timings = []
+            for _ in range(rounds):
+                block_ = decode()
+                start = time.perf_counter()
+                ids(block_)
+                timings.append((time.perf_counter() - start) * 1000)
+            return min(timings)
+
+        block = SignedBlock.unpack(Buffer(data))
+        expected = ids(block)
+        assert ids(invalidated()) == expected and ids(BlockMessage.unpack(Buffer(data)).block) == expected
+        print("%10d %8d %14.3f %10.3f %10.3f %10.3f" % (
+            len(data), len(block.transactions.data), first(invalidated),
+            first(lambda: SignedBlock.unpack(Buffer(data))), first(lambda: BlockMessage.unpack(Buffer(data)).block),
+            _per_call(lambda: ids(block), rounds) / 1000))
+
+
+def bench_export(sizes=(256 * 1024, 1024 * 1024), blocks=4):
+    # NDJSON lines written straight from the bytes, against json.dumps() of the json_object() of decoded blocks
+    print("%10s %12s %12s %14s %16s %12s" % (
+        "block", "tree MB/s", "stream MB/s", "tree peak KiB", "stream peak KiB", "ops/s"))
+    for size in sizes:
+        data = [block_bytes(size, 30000000 + i * 100000) for i in range(blocks)]
+        total = sum(map(len, data)) / 1000000
+
+        def dump_trees(out):
+            for block in data:
+                out.write(json_encode(SignedBlock.unpack(Buffer(block)).json_object()))
+                out.write("\n")
+
+        tree, stream = io.StringIO(), io.StringIO()
+        dump_trees(tree)
+        export_blocks(data, stream)
+        assert stream.getvalue() == tree.getvalue()
+        results = []
+        with open(os.devnull, "w") as out:
+            for f in (dump_trees, lambda out_: export_blocks(data, out_)):
+                start = time.perf_counter()
+                f(out)
+                results.append(total / (time.perf_counter() - start))
+                # memory in use besides the input while exporting, the lines themselves are thrown away
+                tracemalloc.start()
+                f(out)
+                results.append(tracemalloc.get_traced_memory()[1] / 1024)
+                tracemalloc.stop()
+            start = time.perf_counter()
+            lines = export_operations(data, out)
+            ops = lines / (time.perf_counter() - start)
+        print("%10d %12.2f %12.2f %14.0f %16.0f %12.0f" % (
+            len(data[0]), results[0], results[2], results[1], results[3], ops))
+
+
+def bench_columns(blocks=8, size=256 * 1024):
+    # transfer volume per asset over a batch of blocks, walking the decoded objects against numpy over columns which
+    # are extracted once for any number of such aggregations
+    data = [block_bytes(size, 30000000 + i * 100000) for i in range(blocks)]
+    decoded = [SignedBlock.unpack(Buffer(block)) for block in data]
+
+    def walk():
+        res = {}
+        for block in decoded:
+            for trx in block.transactions.data:
+                for operation in trx.operations.data:
+                    operation = operation.data
+                    if type(operation) is TransferOperation:
+                        asset = operation.amount.asset_id.id
+                        res[asset] = res.get(asset, 0) + operation.amount.amount.data
+        return res
+
+    transfers = operation_columns(decoded)[TransferOperation]
+
+    def vectorized():
+        assets = transfers["amount.asset_id"]
+        volume = numpy.zeros(assets.max() + 1, numpy.int64)
+        numpy.add.at(volume, assets, transfers["amount.amount"])
+        return {asset: int(total) for asset, total in enumerate(volume) if total}
+
+    assert vectorized() == walk()
+    for blocks_ in (decoded, data):
+        columns = operation_columns(blocks_)
+        for cls, res in operation_columns(decoded).items():
+            assert all((columns[cls][name] == column).all() for name, column in res.items())
+    operations = sum(len(v["block_num"]) for v in operation_columns(data).values())
+    print("%8s %10s %12s %12s %18s %18s" % (
+        "blocks", "ops", "walk ms", "numpy ms", "extract dec. ms", "extract enc. ms"))
+    print("%8d %10d %12.2f %12.2f %18.1f %18.1f" % (
+        blocks, operations, _per_call(walk, 5) / 1000, _per_call(vectorized, 5) / 1000,
+        _per_call(lambda: operation_columns(decoded), 3) / 1000, _per_call(lambda: operation_columns(data), 3) / 1000))
+
+
+def bench_select(transactions=2000, rounds=3):
+    # blocks mixing transfers with large asset, proposal and parameter updates, decoded in full against decoding
+    # only the transfers and limit orders
+    heavy = [AssetUpdateOperation, ProposalCreateOperation, CommitteeMemberUpdateGlobalParametersOperation]
+    block = operations_block([[(op.opid, sample_bytes(op)) for op in (TransferOperation, heavy[i % len(heavy)])]
+                              for i in range(transactions)])
+    selection = OperationSelection({TransferOperation.opid, LimitOrderCreateOperation.opid})
+    selected = selection.block.unpack(Buffer(block))
+    assert selected.pack() == block and all(
+        trx.id().data == expected.data for trx, expected in zip(selected.transactions.data,
+                                                                SignedBlock.unpack(Buffer(block)).transaction_ids()))
+    print("%10s %8s %12s %14s" % ("block", "trx", "full ms", "selected ms"))
+    print("%10d %8d %12.1f %14.1f" % (
+        len(block), transactions, _per_call(lambda: SignedBlock.unpack(Buffer(block)), rounds) / 1000,
+        _per_call(lambda: selection.block.unpack(Buffer(block)), rounds) / 1000))
+
+
+def bench_interest(blocks=8, size=256 * 1024, watched=3000):
+    # blocks per second decoding everything against decoding only the transactions of watched accounts
+    data = [block_bytes(size, 30000000 + i * 100000) for i in range(blocks)]
+    # a few accounts which are active in the blocks among many which are not
+    accounts = AccountFilter([2000, 3001] + list(range(1000000, 1000000 + watched - 2)))
+
+    def decode():
+        for block in data:
+            SignedBlock.unpack(Buffer(block))
+
+    def filtered():
+        return sum(1 for block in data for _ in accounts.transactions(block))
+
+    matched = filtered()
+    print("%8s %10s %10s %14s %16s" % ("blocks", "watched", "matched", "full blocks/s", "filter blocks/s"))
+    print("%8d %10d %10d %14.1f %16.1f" % (
+        blocks, len(accounts.accounts), matched, blocks * 1000000 / _per_call(decode, 2),
+        blocks * 1000000 / _per_call(filtered, 2)))
+
+
+def bench_pool(workers=(1, 2, 4, 8), blocks=32, size=256 * 1024):
+    # block frames decoded on the receiving thread against a pool of worker processes, results come back in order
+    frames = block_frames(blocks, size)
+    start = time.perf_counter()
+    expected = [decode_block(decode_message(*frame_body(frame))) for frame in frames]
+    single = time.perf_counter() - start
+    print("%8s %12s %10s" % ("workers", "blocks/s", "speedup"))
+    print("%8s %12.1f %10s" % ("none", blocks / single, "1.0"))
+
+    async def sync(pool):
+        done = asyncio.get_running_loop().create_future()
+        results = []
+
+        def on_result(_, result):
+            results.append(result)
+            if len(results) == blocks:
+                done.set_result(results)
+
+        protocol = PeerProtocol(actions={}, decode_pool=pool, on_result=on_result)
+        start_ = time.perf_counter()
+        for frame_ in frames:
+            protocol.receive(frame_)
+        assert await done == expected
+        return time.perf_counter() - start_
+
+    for count in workers:
+        with DecodePool(decode_block, count) as pool:
+            # workers start and load the modules on their first task
+            for future in [pool.submit(*frame_body(frames[0])) for _ in range(count)]:
+                future.result()
+            elapsed = asyncio.run(sync(pool))
+        print("%8d %12.1f %10.1f" % (count, blocks / elapsed, single / elapsed))
+
+
+@contextmanager
+def eager_keys():
+    # decodes every public key into a graphenebase key right away and without sharing, as PublicKey used to
+    intern = PublicKey.__dict__["intern"]
+    PublicKey.intern = staticmethod(lambda raw: PublicKey(GraphenePublicKey(raw.hex(), prefix="BTS")))
+    try:
+        yield
+    finally:
+        PublicKey.intern = intern
+
+
+def bench_keys(transactions=1000, hot=50, rounds=3):
+    # blocks of account creations, 6 keys each, with keys all different or drawn from a few hot ones
+    sample_key = sample_values[PublicKey]
+    keys = [crypto.backend.public_key(crypto.backend.new_secret()) for _ in range(transactions)]
+    account = sample_bytes(AccountCreateOperation)
+    count = transactions * account.count(sample_key)
+    clear_keys = PublicKey.intern.cache_clear
+    print("%10s %8s %12s %12s %16s %16s" % ("keys", "count", "eager ms", "lazy ms", "eager+json ms", "lazy+json ms"))
+    for name, pick in (("distinct", lambda i: keys[i]), ("hot", lambda i: keys[i % hot])):
+        block = operations_block([[(AccountCreateOperation.opid, account.replace(sample_key, pick(i)))]
+                                  for i in range(transactions)])
+
+        def decode(to_json=False):
+            # each round starts without shared keys
+            clear_keys()
+            res = SignedBlock.unpack(Buffer(block))
+            if to_json:
+                res.json_object()
+            return res
+
+        timings = []
+        for to_json in (False, True):
+            with eager_keys():
+                eager = _per_call(lambda: decode(to_json), rounds) / 1000
+                expected = json_encode(decode().json_object())
+            timings.extend((eager, _per_call(lambda: decode(to_json), rounds) / 1000))
+            assert json_encode(decode().json_object()) == expected
+        print("%10s %8d %12.1f %12.1f %16.1f %16.1f" % (name, count, *timings))
+
+
+def bench_addresses(counts=(100, 2000, 20000), rounds=5):
+    # address messages of well-connected nodes, read as Address values, as json text and as a numpy array
+    print("%8s %12s %12s %12s %12s" % ("addresses", "decode ms", "objects ms", "json ms", "numpy ms"))
+    for count in counts:
+        data = bytearray()
+        encode_varint_into(data, count)
+        for i in range(count):
+            data += pack("<IHIq", 0x0a000000 + i * 7919, 1776 + i % 100, 1560000000 + i, 20 + i % 500)
+            data += bytes((i + k) % 256 for k in range(33)) + bytes([i % 2, 2 * (i % 3 == 0)])
+        data = bytes(data)
+
+        def objects():
+            # every field of every address as python values
+            return [(x["remote_endpoint"].data, x["last_seen_time"].data, x["latency"].data, x["node_id"].data,
+                     x["direction"].data, x["firewalled"].data)
+                    for x in AddressMessage.unpack(Buffer(data))["addresses"].data]
+
+        def dump():
+            out = []
+            AddressMessage.dump_json(Buffer(data), out)
+            return "".join(out)
+
+        def array():
+            return address_array(AddressMessage.unpack(Buffer(data))["addresses"])
+
+        message = AddressMessage.unpack(Buffer(data))
+        assert dump() == json_encode(message.json_object())
+        assert list(array()["endpoint"]["port"]) == [x["remote_endpoint"].port for x in message["addresses"].data]
+        print("%8d %12.3f %12.3f %12.3f %12.3f" % (
+            count,
+            _per_call(lambda: AddressMessage.unpack(Buffer(data)), rounds) / 1000,
+            _per_call(objects, rounds) / 1000,
+            _per_call(dump, rounds) / 1000,
+            _per_call(array, rounds) / 1000,
+        ))
+
+
+@contextmanager
+def unshared_ids():
+    # decodes every object id into a new value, as ObjectID used to
+    intern = ObjectID.__dict__["intern"]
+    ObjectID.intern = classmethod(lambda cls, id_: cls(id_))
+    try:
+        yield
+    finally:
+        ObjectID.intern = intern
+
+
+def bench_memory(blocks=32, size=256 * 1024):
+    # memory held by a batch of decoded blocks with shared object ids and without, the ids refer to a few hundred
+    # accounts and assets and to one limit order per transaction
+    data = [block_bytes(size, 30000000 + i * 100000) for i in range(blocks)]
+    operations = sum(len(trx.operations.data) for block in data
+                     for trx in SignedBlock.unpack(Buffer(block)).transactions.data)
+
+    clear_ids = ObjectID.intern.cache_clear
+
+    def decode():
+        # each round starts without shared ids
+        clear_ids()
+        return [SignedBlock.unpack(Buffer(block)) for block in data]
+
+    def measure():
+        tracemalloc.start()
+        decoded = decode()
+        size_, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del decoded
+        return size_ / 1024 / 1024, _per_call(decode, 1) / 1000
+
+    with unshared_ids():
+        unshared = measure()
+    shared = measure()
+    print("%8s %10s %16s %14s %16s %16s %14s" % (
+        "blocks", "ops", "unshared MiB", "shared MiB", "shared KiB/block", "unshared ms", "shared ms"))
+    print("%8d %10d %16.1f %14.1f %16.0f %16.1f %14.1f" % (
+        blocks, operations, unshared[0], shared[0], shared[0] * 1024 / blocks, unshared[1], shared[1]))
+
+
+def bench_trusted(sizes=(256 * 1024, 1024 * 1024), rounds=5):
+    # blocks read back from storage decoded with and without checking the values, the rounds alternate and the best
+    # one of each counts
+    print("%10s %8s %12s %12s" % ("block", "trx", "strict ms", "trusted ms"))
+    with raw_not_kept():
+        for size in sizes:
+            data = block_bytes(size)
+            strict = SignedBlock.unpack(Buffer(data))
+            assert SignedBlock.unpack_trusted(Buffer(data)).pack() == strict.pack()
+            timings = [[], []]
+            for _ in range(rounds):
+                timings[0].append(_per_call(lambda: SignedBlock.unpack(Buffer(data)), 1) / 1000)
+                timings[1].append(_per_call(lambda: SignedBlock.unpack_trusted(Buffer(data)), 1) / 1000)
+            print("%10d %8d %12.1f %12.1f" % (len(data), len(strict.transactions.data), *map(min, timings)))
+
+
+class _StopAndWaitSync:
+    # the previous sync: every id of an inventory in one fetch items message, the next inventory is requested once
+    # the last of those blocks came in
+
+    def __init__(self, start):
+        self.target = start
+        self.blocks = 0
+        self.finished = None
+
+    def start(self, conn):
+        self.finished = asyncio.get_running_loop().create_future()
+        self.request_inventory(conn)
+
+    def request_inventory(self, conn):
+        conn.send(5003, {"item_type": 1001, "blockchain_synopsis": [self.target]})
+
+    def inventory_received(self, msg, conn):
+        ids = [x.data for x in msg["item_hashes_available"].data]
+        if ids[-1] == self.target:
+            self.finished.set_result(self.blocks)
+            return
+        conn.send(5004, {"item_type": 1001, "items_to_fetch": ids})
+        self.target = ids[-1]
+
+    def block_received(self, msg, conn):
+        self.blocks += 1
+        if msg["block_id"].data == self.target:
+            self.request_inventory(conn)
+
+
+def bench_sync(head=10000, latencies=(0.001, 0.01, 0.05), size=0):
+    # block download from a loopback node, round trips take twice the latency. The sync starts after block 1.
+    print("%10s %8s %16s %16s %10s" % ("latency ms", "blocks", "stop+wait blk/s", "pipelined blk/s", "window"))
+    start = block_id(1)
+    for latency in latencies:
+        port_queue = multiprocessing.Queue()
+        stop = multiprocessing.Event()
+        server = multiprocessing.Process(target=mock_chain, args=(port_queue, stop, head, latency, size))
+        server.start()
+        port = port_queue.get()
+
+        async def run(sync):
+            conn = await connect("127.0.0.1", port, sync=sync, actions={
+                1001: block_respond, 5002: blockchain_item_id_inventory_respond})
+            begin = time.perf_counter()
+            sync.start(conn)
+            await sync.finished
+            elapsed = time.perf_counter() - begin
+            conn.close()
+            return sync.blocks / elapsed
+
+        try:
+            serial = asyncio.run(run(_StopAndWaitSync(start)))
+            engine = BlockSync(start)
+            pipelined = asyncio.run(run(engine))
+            assert engine.blocks == head - 1
+        finally:
+            stop.set()
+            server.join()
+        print("%10.0f %8d %16.0f %16.0f %10d" % (latency * 1000, head - 1, serial, pipelined, engine.window))
+
+
+def bench_pool_sync(head=200, workers=(1, 2, 4, 8), size=64 * 1024, latency=0.001):
+    # block sync from a loopback node with every block decoded on the receiving thread against a pool of worker
+    # processes, the rate counts the blocks whose result arrived. The sync starts after block 1.
+    port_queue = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    server = multiprocessing.Process(target=mock_chain, args=(port_queue, stop, head, latency, size))
+    server.start()
+    port = port_queue.get()
+    actions = {1001: block_respond, 5002: blockchain_item_id_inventory_respond}
+
+    async def run(pool):
+        done = asyncio.get_running_loop().create_future()
+        results = []
+
+        def on_result(_, result):
+            results.append(result)
+            if len(results) == head - 1:
+                done.set_result(None)
+
+        if pool is None:
+            sync = BlockSync(block_id(1), on_block=lambda msg: on_result(None, decode_block(msg)))
+            conn = await connect("127.0.0.1", port, sync=sync, actions=actions)
+        else:
+            sync = BlockSync(block_id(1))
+            conn = await connect("127.0.0.1", port, sync=sync, actions=actions, decode_pool=pool, on_result=on_result)
+        begin = time.perf_counter()
+        sync.start(conn)
+        await sync.finished
+        await done
+        elapsed = time.perf_counter() - begin
+        conn.close()
+        assert [x[0] for x in results] == list(range(2, head + 1))
+        return (head - 1) / elapsed
+
+    try:
+        print("%8s %12s %10s" % ("workers", "blocks/s", "speedup"))
+        single = asyncio.run(run(None))
+        print("%8s %12.1f %10s" % ("none", single, "1.0"))
+        frame = block_frames(1, size)[0]
+        for count in workers:
+            with DecodePool(decode_block, count) as pool:
+                # workers start and load the modules on their first task
+                for future in [pool.submit(*frame_body(frame)) for _ in range(count)]:
+                    future.result()
+                rate = asyncio.run(run(pool))
+            print("%8d %12.1f %10.1f" % (count, rate, rate / single))
+    finally:
+        stop.set()
+        server.join()
+
+
+benchmarks = {
+    "connection": bench_connection,
+    "buffer": bench_buffer,
+    "handshake": bench_handshake,
+    "codec": bench_codec,
+    "lazy": bench_lazy,
+    "threads": bench_threads,
+    "varint": bench_varint,
+    "fixed": bench_fixed,
+    "pack": bench_pack,
+    "relay": bench_relay,
+    "ids": bench_ids,
+    "export": bench_export,
+    "columns": bench_columns,
+    "select": bench_select,
+    "interest": bench_interest,
+    "pool": bench_pool,
+    "keys": bench_keys,
+    "addresses": bench_addresses,
+    "memory": bench_memory,
+    "trusted": bench_trusted,
+    "sync": bench_sync,
+    "pool_sync": bench_pool_sync,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run performance benchmarks")
+    parser.add_argument("names", nargs="*", help="benchmarks to run, default all: %s" % ", ".join(benchmarks))
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in benchmarks:
+            parser.error("unknown benchmark %s" % name)
+    logging.basicConfig(level=logging.WARNING)
+    for name in args.names or benchmarks:
+        print("== %s" % name)
+        benchmarks[name]()
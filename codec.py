@@ -0,0 +1,361 @@
+from keyword import iskeyword
+from struct import Struct
+from types import MemberDescriptorType
+
+from basic_types import (
+    owner_setter, DataValue, Bool, Uint8, Uint16, Uint32, Uint64, Int64, FakePublicKey, PublicKey, Signature, SHA1, SHA256,
+    RIPEMD160, IPAddress, IPEndpoint, json_encode)
+from objectids import ObjectID
+from utils import uint16, uint32, uint64, int64
+
+
+# Schema compiler: turns the definition of an Object class into straight-line unpack and pack_into functions.
+# Codecs are built the first time a class is decoded or encoded and cached on the class, they produce exactly what
+# the interpreted loops in Object.unpack_interpreted and Object.pack_into_interpreted do.
+
+# decoding expressions for types which can skip their own unpack(), {t} is the field type and msg the Buffer
+unpack_expressions = {
+    Bool: "{t}(msg.read_uint8() == 1)",
+    Uint8: "{t}(msg.read_uint8())",
+    Uint16: "{t}(msg.read_uint16())",
+    Uint32: "{t}(msg.read_uint32())",
+    Uint64: "{t}(msg.read_uint64())",
+    Int64: "{t}(msg.read_int64())",
+    FakePublicKey: "{t}(msg.read(33).tobytes())",
+    PublicKey: "{t}.intern(msg.read(33).tobytes())",
+    Signature: "{t}(msg.read(65).tobytes())",
+    SHA1: "{t}(msg.read(20).tobytes())",
+    SHA256: "{t}(msg.read(32).tobytes())",
+    RIPEMD160: "{t}(msg.read(20).tobytes())",
+}
+
+# encoding statements for a value {v} already of the field type, writer is the Writer
+pack_statements = {
+    Bool: "writer.write_uint8(1 if {v}.data else 0)",
+    Uint8: "writer.write_uint8({v}.data)",
+    Uint16: "writer.write_uint16({v}.data)",
+    Uint32: "writer.write_uint32({v}.data)",
+    Uint64: "writer.write_uint64({v}.data)",
+    Int64: "writer.write_int64({v}.data)",
+    FakePublicKey: "writer.write({v}.data)",
+    Signature: "writer.write({v}.data)",
+    SHA1: "writer.write({v}.data)",
+    SHA256: "writer.write({v}.data)",
+    RIPEMD160: "writer.write({v}.data)",
+}
+
+# Fixed-width types which get fused with their neighbours into a single struct call.
+# Each entry: struct format when decoding, building expression over the unpacked items {0}, {1}...,
+# struct format when encoding and the items passed for a value {v} of the type.
+fixed_width = {
+    Bool: ("B", "{t}({0} == 1)", "?", "{v}.data"),
+    Uint8: ("B", "{t}({0})", "B", "{v}.data"),
+    Uint16: ("H", "{t}({0})", "H", "{v}.data"),
+    Uint32: ("I", "{t}({0})", "I", "{v}.data"),
+    Uint64: ("Q", "{t}({0})", "Q", "{v}.data"),
+    Int64: ("q", "{t}({0})", "q", "{v}.data"),
+    FakePublicKey: ("33s", "{t}({0})", "33s", "{v}.data"),
+    Signature: ("65s", "{t}({0})", "65s", "{v}.data"),
+    SHA1: ("20s", "{t}({0})", "20s", "{v}.data"),
+    SHA256: ("32s", "{t}({0})", "32s", "{v}.data"),
+    RIPEMD160: ("20s", "{t}({0})", "20s", "{v}.data"),
+    IPAddress: ("I", "{t}.of({0})", "I", "{v}.address"),
+    IPEndpoint: ("IH", "{t}.of({0}, {1})", "IH", "{v}.address, {v}.port"),
+}
+
+# json text of the fixed-width types as a format and the items it takes from the decoded struct items {0}, {1}...
+json_fixed = {
+    Bool: ("%s", "'true' if {0} == 1 else 'false'"),
+    Uint8: ("%d", "{0}"),
+    Uint16: ("%d", "{0}"),
+    Uint32: ("%d", "{0}"),
+    Uint64: ("%d", "{0}"),
+    Int64: ("%d", "{0}"),
+    FakePublicKey: ('"%s"', "{0}.hex()"),
+    Signature: ('"%s"', "{0}.hex()"),
+    SHA1: ('"%s"', "{0}.hex()"),
+    SHA256: ('"%s"', "{0}.hex()"),
+    RIPEMD160: ('"%s"', "{0}.hex()"),
+    IPAddress: ('"%d.%d.%d.%d"', "{0} >> 24, {0} >> 16 & 255, {0} >> 8 & 255, {0} & 255"),
+    IPEndpoint: ('"%d.%d.%d.%d:%d"', "{0} >> 24, {0} >> 16 & 255, {0} >> 8 & 255, {0} & 255, {1}"),
+}
+
+
+class Codec:
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.fields = list(cls.definition.items())
+        self.namespace = {
+            "cls": cls,
+            "new": object.__new__,
+            "kept": kept,
+            "uint16": uint16,
+            "uint32": uint32,
+            "uint64": uint64,
+            "int64": int64,
+        }
+        for i, (name, type_) in enumerate(self.fields):
+            self.namespace["t%d" % i] = type_
+            self.namespace["s%d" % i] = field_setter(cls, name)
+            self.namespace["o%d" % i] = owner_setter(type_)
+        # encoded size when every field has a fixed one, None otherwise
+        sizes = [fixed_size(type_) for _, type_ in self.fields]
+        self.size = None if None in sizes else sum(sizes)
+        # index of the field the bytes in front of which are kept, see Object.hashed
+        self.hashed = None
+        if cls.hashed is not None:
+            self.hashed = [name for name, _ in self.fields].index(cls.hashed)
+            self.namespace["set_prefix"] = field_setter(cls, "_prefix")
+        self.source = "\n".join([
+            self.unpack_source(), "", self.unpack_source(trusted=True), "", self.pack_into_source(), "",
+            self.skip_source(), "", self.skip_source(hashed=True), "", self.dump_json_source()])
+        exec(compile(self.source, "<codec %s>" % cls.__name__, "exec"), self.namespace)
+        self.unpack = self.namespace["unpack"]
+        self.unpack_trusted = self.namespace["unpack_trusted"]
+        self.pack_into = self.namespace["pack_into"]
+        self.skip = self.namespace["skip"]
+        self.skip_hashed = self.namespace["skip_hashed"]
+        self.dump_json = self.namespace["dump_json"]
+
+    def runs(self):
+        # splits the fields into runs of consecutive fixed-width types, runs of consecutive object ids and single
+        # fields, as lists of indices
+        runs = []
+        for i, (_, type_) in enumerate(self.fields):
+            kind = run_kind(type_)
+            if kind is not None and runs and run_kind(self.fields[runs[-1][-1]][1]) == kind and i != self.hashed:
+                runs[-1].append(i)
+            else:
+                runs.append([i])
+        return runs
+
+    def unpack_source(self, trusted=False):
+        # the trusted variant builds values without running the checks in their __init__
+        lines = [
+            "def unpack_trusted(msg):" if trusted else "def unpack(msg):",
+            "    res = new(cls)",
+        ]
+        if self.hashed is not None:
+            lines.append("    view = msg.peek(len(msg))")
+        for run in self.runs():
+            if run[0] == self.hashed:
+                lines.append("    set_prefix(res, kept(view[:len(view) - len(msg)]))")
+            if len(run) == 1:
+                type_ = self.fields[run[0]][1]
+                lines.extend(self.store_lines(run[0], self.unpack_expression(type_, "t%d" % run[0], trusted), trusted))
+                continue
+            if is_object_id(self.fields[run[0]][1]):
+                # object ids are varints, a run of them is decoded in one call
+                lines.append("    v = msg.read_varints(%d)" % len(run))
+                for k, i in enumerate(run):
+                    lines.append("    s%d(res, t%d.intern(v[%d]))" % (i, i, k))
+                continue
+            s = "run%d" % run[0]
+            self.namespace[s] = Struct("<" + "".join(fixed_width[self.fields[i][1]][0] for i in run))
+            lines.append("    v = msg.unpack(%s)" % s)
+            item = 0
+            for i in run:
+                type_ = self.fields[i][1]
+                fmt, expression = fixed_width[type_][:2]
+                items = ["v[%d]" % (item + k) for k in range(item_count(fmt))]
+                item += len(items)
+                lines.extend(self.store_lines(i, expression.format(*items, t="t%d" % i), trusted))
+        lines.append("    return res")
+        return "\n".join(lines)
+
+    def pack_into_source(self):
+        lines = ["def pack_into(self, writer):"]
+        for run in self.runs():
+            for i in run:
+                name, type_ = self.fields[i]
+                t = "t%d" % i
+                lines.extend([
+                    "    v%d = %s" % (i, ("self." + name) if name.isidentifier() and not iskeyword(name) else
+                                    "getattr(self, %r)" % name),
+                    "    if type(v%d) is not %s:" % (i, t),
+                    "        v%d = %s(v%d)" % (i, t, i),
+                ])
+            if is_object_id(self.fields[run[0]][1]):
+                lines.extend("    writer.write_varint(v%d.id)" % i for i in run)
+                continue
+            if len(run) == 1:
+                lines.append("    " + self.pack_statement(self.fields[run[0]][1], "t%d" % run[0], run[0]))
+                continue
+            s = "run%d_pack" % run[0]
+            self.namespace[s] = Struct("<" + "".join(fixed_width[self.fields[i][1]][2] for i in run))
+            lines.append("    writer.write_struct(%s, %s)" % (s, ", ".join(
+                fixed_width[self.fields[i][1]][3].format(v="v%d" % i) for i in run)))
+        lines.append("    return None")
+        return "\n".join(lines)
+
+    def skip_source(self, hashed=False):
+        # consecutive fields of known size are stepped over with a single skip. The hashed variant returns the number
+        # of bytes in front of the hashed field, None for classes without one.
+        lines = ["def skip_hashed(msg):" if hashed else "def skip(msg):"]
+        if hashed and self.hashed is not None:
+            lines.append("    start = len(msg)")
+        pending = 0
+        for run in self.runs():
+            if hashed and run[0] == self.hashed:
+                if pending:
+                    lines.append("    msg.skip(%d)" % pending)
+                    pending = 0
+                lines.append("    size = start - len(msg)")
+            sizes = [fixed_size(self.fields[i][1]) for i in run]
+            if None not in sizes:
+                pending += sum(sizes)
+                continue
+            if pending:
+                lines.append("    msg.skip(%d)" % pending)
+                pending = 0
+            i, type_ = run[0], self.fields[run[0]][1]
+            t = "t%d" % i
+            if is_object_id(type_):
+                lines.append("    msg.read_varints(%d)" % len(run) if len(run) > 1 else "    msg.read_varint()")
+                continue
+            self.namespace[t + "_skip"] = get_codec(type_).skip if is_object(type_) else type_.skip
+            lines.append("    %s_skip(msg)" % t)
+        if pending:
+            lines.append("    msg.skip(%d)" % pending)
+        lines.append("    return size" if hashed and self.hashed is not None else "    return None")
+        return "\n".join(lines)
+
+    def dump_json_source(self):
+        # the json text of fixed-width fields and object ids is formatted straight from the decoded struct items and
+        # varints, the text between two nested values goes out in one append
+        lines = ["def dump_json(msg, out):"]
+        text, items = "{", []
+
+        def flush():
+            if items:
+                lines.append("    out.append(%r %% (%s,))" % (text, ", ".join(items)))
+            elif text:
+                lines.append("    out.append(%r)" % text.replace("%%", "%"))
+
+        for run in self.runs():
+            i, type_ = run[0], self.fields[run[0]][1]
+            keys = [("," if k else "") + json_encode(self.fields[k][0]).replace("%", "%%") + ":" for k in run]
+            if is_object_id(type_):
+                lines.append("    v%d = msg.read_varints(%d)" % (i, len(run)))
+                for k, key in enumerate(keys):
+                    text += key + '"%d.%d.%%d"' % (self.fields[run[k]][1].space, self.fields[run[k]][1].type)
+                    items.append("v%d[%d]" % (i, k))
+                continue
+            if type_ in json_fixed:
+                s = "run%d" % i
+                self.namespace[s] = Struct("<" + "".join(fixed_width[self.fields[k][1]][0] for k in run))
+                lines.append("    v%d = msg.unpack(%s)" % (i, s))
+                item = 0
+                for k, key in zip(run, keys):
+                    fmt, expression = json_fixed[self.fields[k][1]]
+                    count = item_count(fixed_width[self.fields[k][1]][0])
+                    text += key + fmt
+                    items.append(expression.format(*("v%d[%d]" % (i, item + n) for n in range(count))))
+                    item += count
+                continue
+            text += keys[0]
+            flush()
+            text, items = "", []
+            self.namespace["t%d_dump_json" % i] = get_codec(type_).dump_json if is_object(type_) else type_.dump_json
+            lines.append("    t%d_dump_json(msg, out)" % i)
+        text += "}"
+        flush()
+        lines.append("    return None")
+        return "\n".join(lines)
+
+    def store_lines(self, i, expression, trusted):
+        # statements storing the value built by the expression into field i. On the trusted path a DataValue built by
+        # calling its type gets its data set on a bare instance instead, there is no Python call per value left.
+        # Nested objects and containers get res as their owner.
+        t = "t%d" % i
+        type_ = self.fields[i][1]
+        if trusted and isinstance(type_, type) and issubclass(type_, DataValue) and expression.startswith(t + "("):
+            return [
+                "    x = new(%s)" % t,
+                "    x.data = %s" % expression[len(t) + 1:-1],
+                "    s%d(res, x)" % i,
+            ]
+        if self.namespace["o%d" % i] is not None:
+            return [
+                "    x = %s" % expression,
+                "    o%d(x, res)" % i,
+                "    s%d(res, x)" % i,
+            ]
+        return ["    s%d(res, %s)" % (i, expression)]
+
+    def unpack_expression(self, type_, t, trusted=False):
+        if type_ in unpack_expressions:
+            return unpack_expressions[type_].format(t=t)
+        if is_object_id(type_):
+            return "%s.intern(msg.read_varint())" % t
+        # nested objects are decoded by their own codec unless they keep their raw bytes, anything else by a prebound
+        # unpack()
+        method = "unpack_trusted" if trusted else "unpack"
+        unpack = getattr(type_, method, None)
+        if is_object(type_) and not type_.keep_raw:
+            unpack = getattr(get_codec(type_), method)
+        if unpack is None:
+            return "%s.%s(msg)" % (t, method)
+        self.namespace["%s_%s" % (t, method)] = unpack
+        return "%s_%s(msg)" % (t, method)
+
+    def pack_statement(self, type_, t, i):
+        v = "v%d" % i
+        if type_ in pack_statements:
+            return pack_statements[type_].format(v=v)
+        if is_object(type_) and not type_.keep_raw:
+            self.namespace[t + "_pack_into"] = get_codec(type_).pack_into
+            return "%s_pack_into(%s, writer)" % (t, v)
+        return "%s.pack_into(writer)" % v
+
+
+def field_setter(cls, name):
+    # function(obj, value) storing a field straight into its slot, around the __setattr__ of Object
+    slot = getattr(cls, name, None)
+    if type(slot) is MemberDescriptorType:
+        return slot.__set__
+    return lambda obj, value: object.__setattr__(obj, name, value)
+
+
+def kept(view):
+    # bytes to keep from a view of decoded bytes, the view itself when they are immutable and a copy otherwise
+    return view if view.readonly else view.tobytes()
+
+
+def fixed_size(type_):
+    # number of bytes every value of the type takes on the wire, None when it varies
+    if is_object(type_):
+        return get_codec(type_).size
+    return getattr(type_, "size", None)
+
+
+def is_object_id(type_):
+    return issubclass(type_, ObjectID)
+
+
+def run_kind(type_):
+    # fields of the same kind next to each other are decoded together
+    if type_ in fixed_width:
+        return "fixed"
+    if is_object_id(type_):
+        return "object id"
+    return None
+
+
+def item_count(fmt):
+    struct = Struct("<" + fmt)
+    return len(struct.unpack(bytes(struct.size)))
+
+
+def is_object(type_):
+    from objects import Object
+    return issubclass(type_, Object)
+
+
+def get_codec(cls):
+    codec = cls.__dict__.get("_codec")
+    if codec is None:
+        codec = Codec(cls)
+        cls._codec = codec
+    return codec
@@ -0,0 +1,97 @@
+from operator import attrgetter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from basic_types import Bool, Uint8, Uint16, Uint32, Int64
+from codec import is_object
+from objectids import ObjectID
+from operationimpl import SignedBlock, Transaction, OperationVariant, block_number
+from utils import Buffer
+
+
+# Columnar extraction of operations for analytics. Every operation type gets an int64 column per integer field and
+# object id in its definition, fields of nested objects are named by their path like "fee.amount". Object ids keep
+# only their instance number, optional and repeated fields have no column. The position of each operation in the
+# chain comes first as the block_num, trx_in_block and op_in_trx columns.
+
+position_columns = ("block_num", "trx_in_block", "op_in_trx")
+
+# Uint64 values do not fit int64
+integer_types = (Bool, Uint8, Uint16, Uint32, Int64)
+
+# operation class -> column names and a getter returning their values as a tuple
+_getters = {}
+
+
+def column_paths(type_, prefix=""):
+    # (column name, attribute path of the int value) for every field of an object type which has a column
+    res = []
+    for name, field_type in type_.definition.items():
+        if is_object(field_type):
+            res.extend(column_paths(field_type, prefix + name + "."))
+        elif issubclass(field_type, ObjectID):
+            res.append((prefix + name, prefix + name + ".id"))
+        elif field_type in integer_types:
+            res.append((prefix + name, prefix + name + ".data"))
+    return res
+
+
+def _getter(cls):
+    res = _getters.get(cls)
+    if res is None:
+        paths = column_paths(cls)
+        names = position_columns + tuple(name for name, _ in paths)
+        if not paths:
+            getter = lambda operation: ()
+        elif len(paths) == 1:
+            path = attrgetter(paths[0][1])
+            getter = lambda operation: (path(operation),)
+        else:
+            getter = attrgetter(*(path for _, path in paths))
+        res = _getters[cls] = names, getter
+    return res
+
+
+def operation_columns(blocks):
+    # blocks are decoded SignedBlocks or their encodings, returns {operation class: {column name: int64 array}}
+    if numpy is None:
+        raise ImportError("numpy is not installed")
+    # operation class -> values of its rows one after another and the getter of its columns
+    rows = {}
+    for number, trx_in_block, op_in_trx, operation in block_operations(blocks):
+        res = rows.get(type(operation))
+        if res is None:
+            res = rows[type(operation)] = [], _getter(type(operation))[1]
+        res[0].extend((number, trx_in_block, op_in_trx) + res[1](operation))
+    columns = {}
+    for cls, (values, _) in rows.items():
+        names = _getter(cls)[0]
+        # one contiguous row per column
+        array = numpy.array(values, numpy.int64).reshape(len(values) // len(names), len(names)).T.copy()
+        columns[cls] = dict(zip(names, array))
+    return columns
+
+
+def block_operations(blocks):
+    # (block number, transaction index, operation index, operation) of every operation in the blocks, encoded blocks
+    # only have their operations decoded
+    for block in blocks:
+        if isinstance(block, SignedBlock):
+            number = block.number()
+            for trx_in_block, trx in enumerate(block.transactions.data):
+                for op_in_trx, operation in enumerate(trx.operations.data):
+                    yield number, trx_in_block, op_in_trx, operation.data
+            continue
+        msg = Buffer(block)
+        number = block_number(block) + 1
+        msg.skip(SignedBlock.fields_size(block, "transactions"))
+        for trx_in_block in range(msg.read_varint()):
+            for name, type_ in Transaction.definition.items():
+                if name != "operations":
+                    type_.skip(msg)
+                    continue
+                for op_in_trx in range(msg.read_varint()):
+                    yield number, trx_in_block, op_in_trx, OperationVariant.unpack(msg).data
@@ -1,92 +1,295 @@
+import asyncio
 import logging
-import socket
 import threading
+from collections import deque
 from hashlib import sha256, sha512
-from struct import pack, unpack
+from struct import Struct, unpack
 
 import cityhash
 from Cryptodome.Cipher import AES
-# noinspection PyProtectedMember
-from graphenebase import PublicKey as GraphenePublicKey, PrivateKey, ecdsa
 
+import crypto
 from basic_types import String
-from messages import parse_message, message_type_table
-from utils import Buffer
+from messages import (
+    parse_message, message_type_table, message_action_table, frame_body, decode_message, decode_header,
+    dispatch_message)
+from sync import BlockSync
+from utils import Buffer, Writer
 
 
-class Connection:
+CHAIN_ID = bytes.fromhex("4018d7844c78f6a6c41c6a552b898022310fc5dec06da467ee7905a8dad512c8")
+
+# length and type in front of every message
+frame_header = Struct("<II")
+
 
-    def __init__(self, ip, port):
+class FrameReader:
+    # Receive side of a session. The transport reads straight into a preallocated buffer, every read has its largest
+    # 16 byte aligned prefix decrypted right away and the remaining partial block is carried over to the next one.
+
+    def __init__(self, size=65536):
+        self.decryptor = None
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.pending = 0
         self.stream = Buffer()
-        self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.s.connect((ip, port))
-        raw_pk = self.s.recv(33)
-        self.pk = GraphenePublicKey(raw_pk.hex())
-        sk = PrivateKey()
-        point = self.pk.point() * int.from_bytes(bytes(sk), "big")
-        x: int = point.x()
-        raw_data = x.to_bytes(32, "big")
-        self.shared_secret = sha512(raw_data).digest()
+
+    def get_buffer(self):
+        return self.view[self.pending:]
+
+    def received(self, nbytes):
+        self.pending += nbytes
+
+    def take(self, size):
+        # removes plain bytes from the front, used for the key exchange before decryption starts
+        data = bytes(self.view[:size])
+        self.buffer[:self.pending - size] = bytes(self.view[size:self.pending])
+        self.pending -= size
+        return data
+
+    def decrypt(self):
+        aligned = self.pending - self.pending % 16
+        if aligned == 0:
+            return
+        msg = self.decryptor.decrypt(self.view[:aligned])
+        self.buffer[:self.pending - aligned] = self.view[aligned:self.pending]
+        self.pending -= aligned
+        self.stream.write(msg)
+        logging.debug("RECV <<< %s" % msg)
+
+    def frames(self):
+        # yields every complete frame decrypted so far
+        self.decrypt()
+        stream = self.stream
+        while stream.count() >= 8:
+            size = unpack("<I", stream.peek(4))[0]
+            expect = size + 8 + (16 - (size + 8) % 16) % 16
+            logging.debug("expect %s have %s" % (expect, stream.count()))
+            if expect > stream.count():
+                break
+            yield stream.read(expect)
+
+
+class PeerProtocol(asyncio.BufferedProtocol):
+    # A single peer session on an event loop: key exchange, encrypted framing and message dispatch.
+    # The node which accepted the TCP connection sends its public key first, the other side answers with its own.
+    # With a decode_pool, messages of its types are decoded in worker processes, see pool.py. Here they are only
+    # decoded as far as unpack_header() goes before their actions run, a block message up to its block id. The results
+    # of the workers go to on_result(message type, result) in the order the messages came in.
+    # Block sync state lives in the sync engine of the session, a BlockSync unless another one is given.
+
+    def __init__(self, actions=None, server_side=False, backend=None, decode_pool=None, on_result=None, sync=None):
+        if decode_pool is not None and on_result is None:
+            raise ValueError("A decode pool needs on_result to take its results")
+        self.actions = message_action_table if actions is None else actions
+        self.sync = BlockSync() if sync is None else sync
+        self.decode_pool = decode_pool
+        self.on_result = on_result
+        # (message type, asyncio future of the result) of the pooled messages not handed to on_result yet
+        self.results = deque()
+        self.server_side = server_side
+        self.crypto = crypto.backend if backend is None else backend
+        self.transport = None
+        self.secret = self.crypto.new_secret()
+        self.public_key = self.crypto.public_key(self.secret)
+        self.pk = None
+        self.shared_secret = None
+        self.encryptor = None
+        self.reader = FrameReader()
+        self.outgoing = Writer()
+        self.flush_handle = None
+        loop = asyncio.get_running_loop()
+        self.ready = loop.create_future()
+        self.closed = loop.create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self.server_side:
+            transport.write(self.public_key)
+
+    def get_buffer(self, sizehint):
+        return self.reader.get_buffer()
+
+    def buffer_updated(self, nbytes):
+        self.reader.received(nbytes)
+        if self.encryptor is None:
+            if self.reader.pending < 33:
+                return
+            self.key_exchange(self.reader.take(33))
+        for frame in self.reader.frames():
+            if self.decode_pool is None:
+                parse_message(frame, self, 2, self.actions)
+            else:
+                self.receive(frame)
+
+    def receive(self, frame):
+        msg_type, body = frame_body(frame)
+        if msg_type in self.decode_pool.message_types:
+            future = asyncio.wrap_future(self.decode_pool.submit(msg_type, body))
+            future.add_done_callback(self.drain)
+            self.results.append((msg_type, future))
+            message = decode_header(msg_type, body)
+        else:
+            message = decode_message(msg_type, body)
+        logging.info("\033[32mRECV <<< \033[0m%s", message)
+        dispatch_message(msg_type, message, self, self.actions)
+
+    def drain(self, _=None):
+        # hands every result at the front of the queue which is no longer waiting for a worker to on_result
+        results = self.results
+        while results:
+            msg_type, future = results[0]
+            if not future.done():
+                return
+            results.popleft()
+            if future.cancelled() or future.exception() is not None:
+                logging.error("Decoding %s failed", message_type_table[msg_type].__name__,
+                              exc_info=None if future.cancelled() else future.exception())
+                continue
+            self.on_result(msg_type, future.result())
+
+    def key_exchange(self, raw_pk):
+        self.pk = raw_pk
+        self.shared_secret = sha512(self.crypto.ecdh(self.secret, raw_pk)).digest()
         key = sha256(self.shared_secret).digest()
         crc = cityhash.CityHash128(self.shared_secret)
         data = crc.to_bytes(16, "little")
         iv = data[8:16] + data[:8]
-        self.s.sendall(bytes.fromhex(repr(sk.pubkey)))
+        if not self.server_side:
+            self.transport.write(self.public_key)
         self.encryptor = AES.new(key, AES.MODE_CBC, iv)
-        self.test = AES.new(key, AES.MODE_CBC, iv)
-        self.decryptor = AES.new(key, AES.MODE_CBC, iv)
-        self.worker_thread = threading.Thread(target=self.worker)
-        self.worker_thread.start()
-        self.send(5006, {
-            "user_agent": "Haruka Mock Client",
-            "core_protocol_version": 106,
-            "inbound_address": "0.0.0.0",
-            "inbound_port": 0,
-            "outbound_port": 0,
-            "node_public_key": sk.pubkey,
-            "signed_shared_secret": ecdsa.sign_message(self.shared_secret, str(sk)),
-            "chain_id": bytes.fromhex("4018d7844c78f6a6c41c6a552b898022310fc5dec06da467ee7905a8dad512c8"),
-            "user_data": {
-                "platform": String("unknown")
-            }
-        })
-
-    def send(self, msg_type, data: dict):
+        self.reader.decryptor = AES.new(key, AES.MODE_CBC, iv)
+        if not self.server_side:
+            self.send(5006, {
+                "user_agent": "Haruka Mock Client",
+                "core_protocol_version": 106,
+                "inbound_address": "0.0.0.0",
+                "inbound_port": 0,
+                "outbound_port": 0,
+                "node_public_key": self.public_key,
+                "signed_shared_secret": self.crypto.sign_compact(self.shared_secret, self.secret),
+                "chain_id": CHAIN_ID,
+                "user_data": {
+                    "platform": String("unknown")
+                }
+            })
+        self.ready.set_result(self)
+
+    def send(self, msg_type, data):
+        # serializes the message into the outgoing frame queue, queued frames leave together on the next flush
+        # header, body and padding are written straight into the queue, the length is filled in after the body
+        # data is a dict of fields or an already built message of that type
         message_type = message_type_table[msg_type]
-        message = message_type(data)
-        res = message.pack()
-        # for name, type_ in definition.items():
-        #     res.extend(pack_field(data.get(name, None), type_))
-        length = len(res)
-        if length % 16 != 8:
-            pad_length = (8 - length % 16)
-            if pad_length < 0:
-                pad_length += 16
-            res += b"\x00" * pad_length
-        res = pack("<II", length, msg_type) + res
-        data = self.encryptor.encrypt(res)
-        logging.debug("SEND >>> %s" % res)
-        parse_message(res, None, 1)
-        self.s.sendall(data)
-
-    def worker(self):
-        data = bytearray()
-        while True:
-            data.extend(self.s.recv(65535))
-            if len(data) % 16 == 0:
-                msg = self.decryptor.decrypt(bytes(data))
-            else:
-                continue
-            data = bytearray()
-            self.stream.write(msg)
-            if len(msg) == 0:
-                break
-            logging.debug("RECV <<< %s" % msg)
-            while self.stream.count():
-                size = unpack("<I", self.stream.peek(4))[0]
-                expect = size + 8 + (16 - (size + 8) % 16) % 16
-                logging.debug("expect %s have %s" % (expect, self.stream.count()))
-                if expect <= self.stream.count():
-                    parse_message(self.stream.read(expect), self, 2)
-                else:
-                    break
+        message = data if type(data) is message_type else message_type(data)
+        outgoing = self.outgoing
+        start = outgoing.tell()
+        outgoing.write_struct(frame_header, 0, msg_type)
+        message.pack_into(outgoing)
+        length = outgoing.tell() - start - frame_header.size
+        outgoing.patch(start, frame_header, length, msg_type)
+        outgoing.write_zeros(-(length + frame_header.size) % 16)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            # trace decode of what actually goes out on the wire
+            frame = bytes(outgoing[start:])
+            logging.debug("SEND >>> %s" % frame)
+            parse_message(frame, None, 1)
+        else:
+            logging.info("\033[36mSEND >>> \033[0m%s", type(message).__name__)
+        if self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_soon(self.flush)
+
+    def relay(self, message):
+        # forwards a received message, messages which kept their wire bytes are sent without encoding them again
+        self.send(message.message_id, message)
+
+    def flush(self):
+        # encrypts every queued frame with one CBC call, in place, and hands them to the transport in one write
+        self.flush_handle = None
+        if len(self.outgoing) == 0 or self.transport.is_closing():
+            return
+        data = self.outgoing
+        self.outgoing = Writer()
+        self.encryptor.encrypt(data, output=data)
+        self.transport.write(data)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def connection_lost(self, exc):
+        if not self.ready.done():
+            self.ready.set_exception(exc or ConnectionError("Connection closed during handshake"))
+        if not self.closed.done():
+            self.closed.set_result(exc)
+
+
+async def connect(ip, port, **kwargs):
+    # Opens a session on the running loop and returns the protocol once the key exchange is done.
+    loop = asyncio.get_running_loop()
+    _, protocol = await loop.create_connection(lambda: PeerProtocol(**kwargs), ip, port)
+    await protocol.ready
+    return protocol
+
+
+class Connection:
+    # Blocking wrapper for scripts. Every Connection shares one event loop running in a background thread,
+    # which exits once the last connection has been closed.
+
+    _loop = None
+    _loop_thread = None
+    _open = 0
+    _lock = threading.Lock()
+
+    def __init__(self, ip, port, **kwargs):
+        self.loop = loop = self._acquire_loop()
+        try:
+            self.protocol = asyncio.run_coroutine_threadsafe(connect(ip, port, **kwargs), loop).result()
+        except BaseException:
+            self._release_loop()
+            raise
+        self._closed = threading.Event()
+        loop.call_soon_threadsafe(self.protocol.closed.add_done_callback, self._on_closed)
+
+    def _on_closed(self, _):
+        self._closed.set()
+        self._release_loop()
+
+    @classmethod
+    def _acquire_loop(cls):
+        with cls._lock:
+            if cls._loop is None:
+                cls._loop = asyncio.new_event_loop()
+                cls._loop_thread = threading.Thread(target=cls._run_loop, args=(cls._loop,))
+                cls._loop_thread.start()
+            cls._open += 1
+            return cls._loop
+
+    @staticmethod
+    def _run_loop(loop):
+        loop.run_forever()
+        loop.close()
+
+    @classmethod
+    def _release_loop(cls):
+        with cls._lock:
+            cls._open -= 1
+            if cls._open == 0:
+                cls._loop.call_soon_threadsafe(cls._loop.stop)
+                cls._loop = None
+
+    @property
+    def shared_secret(self):
+        return self.protocol.shared_secret
+
+    def send(self, msg_type, data):
+        self.loop.call_soon_threadsafe(self.protocol.send, msg_type, data)
+
+    def relay(self, message):
+        self.loop.call_soon_threadsafe(self.protocol.relay, message)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.protocol.close)
+
+    def wait(self, timeout=None):
+        # blocks until the remote side or close() ends the session
+        return self._closed.wait(timeout)
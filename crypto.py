@@ -0,0 +1,113 @@
+import os
+from abc import ABCMeta, abstractmethod
+from hashlib import sha256
+
+# noinspection PyProtectedMember
+from graphenebase import PublicKey as GraphenePublicKey, PrivateKey, ecdsa
+
+try:
+    import coincurve
+except ImportError:
+    coincurve = None
+
+
+# Elliptic curve operations used by the handshake. Keys are passed around as raw bytes: 32 byte secrets and 33 byte
+# compressed public keys. Signatures use the graphene compact format, a recovery byte followed by r and s.
+
+SECP256K1_ORDER = 0xfffffffffffffffffffffffffffffffebaaedce6af48a03bbfd25e8cd0364141
+
+
+class CryptoBackend(metaclass=ABCMeta):
+
+    @property
+    @abstractmethod
+    def name(self):
+        pass
+
+    @staticmethod
+    def new_secret():
+        while True:
+            secret = os.urandom(32)
+            if 0 < int.from_bytes(secret, "big") < SECP256K1_ORDER:
+                return secret
+
+    @abstractmethod
+    def public_key(self, secret: bytes):
+        pass
+
+    # x coordinate of the shared point, the session keys are derived from it
+    @abstractmethod
+    def ecdh(self, secret: bytes, public_key: bytes):
+        pass
+
+    # messages are hashed with sha256 before signing
+    @abstractmethod
+    def sign_compact(self, message: bytes, secret: bytes):
+        pass
+
+    @abstractmethod
+    def recover_compact(self, message: bytes, signature: bytes):
+        pass
+
+
+class GrapheneBackend(CryptoBackend):
+    # pure python math from graphenebase
+
+    name = "graphenebase"
+
+    def public_key(self, secret: bytes):
+        return bytes(PrivateKey(secret.hex()).pubkey)
+
+    def ecdh(self, secret: bytes, public_key: bytes):
+        point = GraphenePublicKey(public_key.hex()).point() * int.from_bytes(secret, "big")
+        x: int = point.x()
+        return x.to_bytes(32, "big")
+
+    def sign_compact(self, message: bytes, secret: bytes):
+        return ecdsa.sign_message(message, str(PrivateKey(secret.hex())))
+
+    def recover_compact(self, message: bytes, signature: bytes):
+        key = ecdsa.recover_public_key(sha256(message).digest(), signature[1:], (signature[0] - 27) & 3)
+        if not hasattr(key, "to_string"):
+            # graphenebase hands back a libsecp256k1 key when that module is present
+            return key.serialize(compressed=True)
+        raw = key.to_string()
+        return bytes([3] if raw[63] % 2 == 1 else [2]) + raw[:32]
+
+
+class CoincurveBackend(CryptoBackend):
+    # libsecp256k1 through coincurve
+
+    name = "coincurve"
+
+    def public_key(self, secret: bytes):
+        return coincurve.PrivateKey(secret).public_key.format()
+
+    def ecdh(self, secret: bytes, public_key: bytes):
+        return coincurve.PublicKey(public_key).multiply(secret).format()[1:]
+
+    def sign_compact(self, message: bytes, secret: bytes):
+        signature = coincurve.PrivateKey(secret).sign_recoverable(message)
+        return bytes([31 + signature[64]]) + signature[:64]
+
+    def recover_compact(self, message: bytes, signature: bytes):
+        signature = signature[1:] + bytes([(signature[0] - 27) & 3])
+        return coincurve.PublicKey.from_signature_and_message(signature, message).format()
+
+
+backends = {
+    GrapheneBackend.name: GrapheneBackend,
+    CoincurveBackend.name: CoincurveBackend,
+}
+
+
+def get_backend(name=None):
+    # the named backend, or the fastest one available
+    if name is None:
+        name = CoincurveBackend.name if coincurve is not None else GrapheneBackend.name
+    if name == CoincurveBackend.name and coincurve is None:
+        raise ImportError("coincurve is not installed")
+    return backends[name]()
+
+
+backend = get_backend()
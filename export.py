@@ -0,0 +1,53 @@
+from operationimpl import SignedBlock, Transaction, OperationVariant, OpResult, block_number
+from utils import Buffer
+
+
+# NDJSON export of encoded blocks, e.g. the bodies of block messages. Lines are written straight from the bytes
+# through dump_json(), one block is held in memory at a time. The text is the json_object() of the same values.
+
+
+def export_blocks(blocks, out):
+    # one line per block, returns the number of lines written to the text stream out
+    lines = 0
+    for data in blocks:
+        parts = []
+        SignedBlock.dump_json(Buffer(data), parts)
+        parts.append("\n")
+        out.write("".join(parts))
+        lines += 1
+    return lines
+
+
+def export_operations(blocks, out):
+    # one line per operation with its position in the chain and its result, named like the operation history
+    # objects of the API nodes
+    lines = 0
+    for data in blocks:
+        msg = Buffer(data)
+        number = block_number(data) + 1
+        msg.skip(SignedBlock.fields_size(data, "transactions"))
+        for trx_in_block in range(msg.read_varint()):
+            operations = []
+            results = []
+            for name, type_ in Transaction.definition.items():
+                if name == "operations":
+                    operations = _dump_items(OperationVariant, msg)
+                elif name == "operation_results":
+                    results = _dump_items(OpResult, msg)
+                else:
+                    type_.skip(msg)
+            for op_in_trx, (operation, result) in enumerate(zip(operations, results)):
+                out.write('{"block_num":%d,"trx_in_block":%d,"op_in_trx":%d,"op":%s,"result":%s}\n' % (
+                    number, trx_in_block, op_in_trx, operation, result))
+                lines += 1
+    return lines
+
+
+def _dump_items(type_, msg: Buffer):
+    # json text of each item of a vector
+    res = []
+    for _ in range(msg.read_varint()):
+        parts = []
+        type_.dump_json(msg, parts)
+        res.append("".join(parts))
+    return res
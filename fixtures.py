@@ -0,0 +1,152 @@
+import asyncio
+from struct import pack, unpack
+
+from basic_types import VarInt, Signature, RIPEMD160
+from connection import PeerProtocol
+from messages import BlockMessage
+from objectimpl import EmptyExtension
+from operationimpl import TransferOperation, LimitOrderCreateOperation, LimitOrderCancelOperation
+from utils import Buffer
+
+
+# Synthetic chain data shared by the tests and benchmark.py, encoded piece by piece through the pack() of each field
+# type.
+
+
+def _operations(i):
+    yield TransferOperation.opid, TransferOperation({
+        "fee": {"amount": 20000 + i, "asset_id": 0},
+        "from": 1000 + i % 977,
+        "to": 2000 + i % 331,
+        "amount": {"amount": 100000 * i, "asset_id": i % 5},
+        "memo": None,
+        "extensions": EmptyExtension(),
+    }), b"\x00"
+    yield LimitOrderCreateOperation.opid, LimitOrderCreateOperation({
+        "fee": {"amount": 500, "asset_id": 0},
+        "seller": 3000 + i % 149,
+        "amount_to_sell": {"amount": 12345 * i, "asset_id": 0},
+        "min_to_receive": {"amount": 54321 * i, "asset_id": 121},
+        "expiration": 1600000000 + i,
+        "fill_or_kill": i % 2 == 0,
+        "extensions": EmptyExtension(),
+    }), b"\x01" + pack("<Q", 1 << 56 | 7 << 48 | 700000 + i)
+    yield LimitOrderCancelOperation.opid, LimitOrderCancelOperation({
+        "fee": {"amount": 100, "asset_id": 0},
+        "order": 700000 + i,
+        "fee_paying_account": 3000 + i % 149,
+        "extensions": EmptyExtension(),
+    }), b"\x02" + pack("<q", 12345 * i) + VarInt(0).pack()
+
+
+def transaction_bytes(i):
+    # a processed transaction as found in a block, with one operation of each kind above
+    res = bytearray(pack("<HII", i & 0xffff, i * 2654435761 & 0xffffffff, 1560000000 + i))
+    results = bytearray()
+    operations = list(_operations(i))
+    res.extend(VarInt(len(operations)).pack())
+    for opid, operation, result in operations:
+        res.extend(VarInt(opid).pack())
+        res.extend(operation.pack())
+        results.extend(result)
+    res.extend(VarInt(0).pack())
+    res.extend(VarInt(1).pack())
+    res.extend(Signature(bytes([0x1f]) + bytes(64)).pack())
+    res.extend(VarInt(len(operations)).pack())
+    res.extend(results)
+    return res
+
+
+def block_bytes(size=2 * 1024 * 1024, number=30000000):
+    # body of a BlockMessage holding at least size bytes worth of transactions
+    transactions = []
+    total = 0
+    while total < size:
+        transactions.append(transaction_bytes(number + len(transactions)))
+        total += len(transactions[-1])
+    res = bytearray(pack(">I", number - 1) + bytes(16))
+    res.extend(pack("<I", 1560000000))
+    res.extend(VarInt(42).pack())
+    res.extend(bytes(20))
+    res.extend(VarInt(0).pack())
+    res.extend(Signature(bytes([0x20]) + bytes(64)).pack())
+    res.extend(VarInt(len(transactions)).pack())
+    for trx in transactions:
+        res.extend(trx)
+    res.extend(RIPEMD160(pack(">I", number) + bytes(16)).pack())
+    return bytes(res)
+
+
+def operations_block(transactions):
+    # signed block of transactions given as lists of (opid, encoded operation), every result is null
+    block = bytearray(block_bytes(0))[:-21]
+    block.extend(VarInt(len(transactions)).pack())
+    for i, operations in enumerate(transactions):
+        block.extend(pack("<HII", i, i, 1560000000 + i) + VarInt(len(operations)).pack())
+        for opid, data in operations:
+            block.extend(VarInt(opid).pack() + data)
+        block.extend(VarInt(0).pack() + VarInt(1).pack() + Signature(bytes([0x1f]) + bytes(64)).pack())
+        block.extend(VarInt(len(operations)).pack() + b"\x00" * len(operations))
+    return bytes(block)
+
+
+def block_frames(count, size, number=30000000):
+    # unencrypted frames of block messages as they come off the wire, padded to the cipher block size
+    res = []
+    for i in range(count):
+        body = block_bytes(size, number + i)
+        frame = pack("<II", len(body), BlockMessage.message_id) + body
+        res.append(frame + bytes(-len(frame) % 16))
+    return res
+
+
+def decode_block(message):
+    # what a decode pool does with every block in the tests and benchmarks: all transactions decoded, only their
+    # count goes back
+    block = message.block
+    transactions = block.transactions.data
+    for i in range(len(transactions)):
+        transactions[i]
+    return block.number(), len(transactions)
+
+
+def block_id(number):
+    # id of block number in the synthetic chain, the number followed by zeros
+    return pack(">I", number) + bytes(16)
+
+
+def mock_chain(port_queue, stop, head, latency, size, inventory_limit=2000, unavailable=(), dropped=()):
+    # serves the blocks 1 to head of a chain like a node does, each reply goes out latency seconds after its request.
+    # The blocks numbered in unavailable are answered with item not available messages, those in dropped not at all.
+    template = block_bytes(size)
+
+    def inventory(msg, conn):
+        first = unpack(">I", msg["blockchain_synopsis"].data[0].data[:4])[0]
+        last = min(first + inventory_limit - 1, head)
+        asyncio.get_running_loop().call_later(latency, conn.send, 5002, {
+            "total_remaining_item_count": head - last,
+            "item_type": 1001,
+            "item_hashes_available": [block_id(n) for n in range(first, last + 1)]
+        })
+
+    def items(msg, conn):
+        replies = []
+        for item in msg["items_to_fetch"].data:
+            number = unpack(">I", item.data[:4])[0]
+            if number in dropped:
+                continue
+            if number in unavailable:
+                replies.append((5005, {"requested_item": {"item_type": 1001, "item_hash": item.data}}))
+                continue
+            body = pack(">I", number - 1) + template[4:-20] + block_id(number)
+            replies.append((1001, BlockMessage.unpack(Buffer(body))))
+        asyncio.get_running_loop().call_later(latency, lambda: [conn.send(*reply) for reply in replies])
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(
+            lambda: PeerProtocol(actions={5003: inventory, 5004: items}, server_side=True), "127.0.0.1", 0)
+        port_queue.put(server.sockets[0].getsockname()[1])
+        await loop.run_in_executor(None, stop.wait)
+        server.close()
+    asyncio.run(serve())
@@ -1,66 +1,162 @@
-
-
+import copyreg
 from abc import ABCMeta, abstractmethod
 from collections import OrderedDict
+from collections.abc import Sequence, MutableSequence
+from operator import getitem
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-from basic_types import Serializable, VarInt, JSONSerializable
-from utils import Buffer
+from basic_types import Serializable, JSONSerializable, new, owner_setter, adopt, changed
+from codec import fixed_size, get_codec, is_object
+from objectids import ObjectID
+from utils import Buffer, Writer
 
 
 # Generic types
 
-# Subscripting the type itself returns a instance of the type with type attribute set.
-# Further calls imitate __init__ by setting the actual data.
+# Subscripting the type itself returns a subclass with the types attribute set, one per set of arguments.
+# The subclass is the type descriptor and never changes, calling it creates a value like any other type does.
 # Try to convert to designated type and rely on lower-level exceptions.
+# Containers are the owners of the values they hold, see basic_types.changed().
 
 
-class GenericType(metaclass=ABCMeta):
-    @abstractmethod
-    def __init__(self, types):
-        self.types = types
+class GenericMeta(ABCMeta):
+    pass
+
+
+# parameterized classes are created at runtime, so they are pickled as the subscription which creates them
+def _reduce_generic(cls):
+    if cls.__dict__.get("selected") is not None:
+        return cls.__base__.select, (tuple(sorted(cls.selected)),)
+    if "origin" not in cls.__dict__:
+        return cls.__qualname__
+    return getitem, (cls.origin, cls.types)
+
+
+copyreg.pickle(GenericMeta, _reduce_generic)
+
+
+class GenericType(metaclass=GenericMeta):
+
+    __slots__ = ("_owner",)
+
+    types = None
+
+    # parameterized subclasses, keyed by generic class and arguments
+    _parameterized = {}
+
+    def __new__(cls, *args, **kwargs):
+        if cls.types is None:
+            raise TypeError("%s needs to be subscripted with its types" % cls.__name__)
+        return super().__new__(cls)
 
     def __class_getitem__(cls, item):
         if not isinstance(item, tuple):
             item = item,
-        if not all(isinstance(x, type) or isinstance(x, GenericType) for x in item):
-            raise TypeError
-        return cls(item)
+        if not all(isinstance(x, type) for x in item):
+            raise TypeError("Arguments must be types")
+        key = cls, item
+        res = GenericType._parameterized.get(key)
+        if res is None:
+            cls.check_types(item)
+            name = "%s[%s]" % (cls.__name__, ", ".join(x.__name__ for x in item))
+            res = type(name, (cls,), {"types": item, "origin": cls, "__module__": cls.__module__, "__slots__": ()})
+            res = GenericType._parameterized.setdefault(key, res)
+        return res
+
+    @classmethod
+    @abstractmethod
+    def check_types(cls, types):
+        pass
+
+    @abstractmethod
+    def nested(self):
+        # the values held which have an owner
+        pass
+
+    # pickled without the owner, which would take the values above along, the nested values get theirs back
+    def __getstate__(self):
+        return {name: getattr(self, name) for cls in type(self).__mro__ for name in cls.__dict__.get("__slots__", ())
+                if name != "_owner" and hasattr(self, name)}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+        for value in self.nested():
+            adopt(self, value)
 
 class Vector(Serializable, JSONSerializable, GenericType):
-    def __init__(self, types):
+
+    __slots__ = ("data",)
+
+    @classmethod
+    def check_types(cls, types):
         if len(types) != 1:
             raise TypeError("Vector should only have 1 type")
-        if not isinstance(types[0], type) and not isinstance(types[0], GenericType):
-            raise TypeError("Argument must be type")
-        super().__init__(types)
 
     # enforce same type of items
-    def __call__(self, data):
+    def __init__(self, data):
+        if isinstance(data, FixedList):
+            self.data = data
+            data._owner = self
+            return
         if type(data) is not list:
             raise TypeError("Unsupported type %s, expected list" % type(data).__name__)
-        self.data = []
-        for item in data:
-            # type is generic, item has same type, item is initialized
-            if isinstance(self.types[0], GenericType) and isinstance(item, type(self.types[0])) and getattr(item, "data", None):
-                self.data.append(item)
-            elif isinstance(item, self.types[0]):
-                self.data.append(item)
-            else:
-                self.data.append(self.types[0](item))
-        return self
-
-    def unpack(self, msg: Buffer):
-        obj = []
-        count = VarInt.unpack(msg)
-        for _ in range(count):
-            obj.append(self.types[0].unpack(msg))
-        return self(obj)
+        item_type = self.types[0]
+        self.data = [item if isinstance(item, item_type) else item_type(item) for item in data]
+        for item in self.nested():
+            adopt(self, item)
+
+    # trusted skips the checks of the item values, see Serializable.unpack_trusted()
+    @classmethod
+    def unpack(cls, msg: Buffer, trusted=False):
+        res = new(cls)
+        item_type = cls.types[0]
+        size = fixed_size(item_type)
+        if size:
+            res.data = FixedList.unpack(item_type, size, msg)
+            res.data._owner = res
+            return res
+        if issubclass(item_type, ObjectID):
+            res.data = list(map(item_type.intern, msg.read_varints(msg.read_varint())))
+            return res
+        unpack = item_type.unpack_trusted if trusted else item_type.unpack
+        res.data = [unpack(msg) for _ in range(msg.read_varint())]
+        own = owner_setter(item_type)
+        if own is not None:
+            for item in res.data:
+                own(item, res)
+        return res
 
-    def pack(self):
-        res = VarInt(len(self.data)).pack()
+    @classmethod
+    def unpack_trusted(cls, msg: Buffer):
+        return cls.unpack(msg, True)
+
+    @classmethod
+    def skip(cls, msg: Buffer):
+        count = msg.read_varint()
+        size = fixed_size(cls.types[0])
+        if size is not None:
+            msg.skip(count * size)
+        elif issubclass(cls.types[0], ObjectID):
+            msg.read_varints(count)
+        else:
+            for _ in range(count):
+                cls.types[0].skip(msg)
+
+    def pack_into(self, writer: Writer):
+        writer.write_varint(len(self.data))
+        if isinstance(self.data, FixedList):
+            self.data.pack_into(writer)
+            return
         for i in self.data:
-            res.extend(i.pack())
-        return res
+            i.pack_into(writer)
+
+    def nested(self):
+        return self.data if type(self.data) is list else [self.data]
 
     def __repr__(self):
         return "[" + ", ".join(list(map(repr, self.data))) + "]"
@@ -68,56 +164,319 @@ class Vector(Serializable, JSONSerializable, GenericType):
     def json_object(self):
         return list([x.json_object() for x in self.data])
 
+    @classmethod
+    def dump_json(cls, msg: Buffer, out: list):
+        count = msg.read_varint()
+        if count == 0:
+            out.append("[]")
+            return
+        dump_json = cls.types[0].dump_json
+        out.append("[")
+        dump_json(msg, out)
+        for _ in range(count - 1):
+            out.append(",")
+            dump_json(msg, out)
+        out.append("]")
+
+class FixedList(MutableSequence):
+    # Items of a fixed-size type kept back to back in one bytes object. An item is created the first time it is
+    # accessed and kept from then on, so changes to it are packed. The first change to the list itself decodes every
+    # item, after that it works like a list of them.
+
+    # the Vector holding the list
+    _owner = None
+
+    def __init__(self, type_, size: int, raw: bytes):
+        self.type = type_
+        self.size = size
+        self.raw = raw
+        # decoded items by index, None for those not accessed yet, and no list at all before the first access
+        self.items = None
+
+    @staticmethod
+    def unpack(type_, size: int, msg: Buffer):
+        count = msg.read_varint()
+        view = msg.read(count * size)
+        if len(view) != count * size:
+            raise IndexError("Vector of %d %s needs %d bytes, only %d left" % (
+                count, type_.__name__, count * size, len(view)))
+        return FixedList(type_, size, view.tobytes())
+
+    def __len__(self):
+        return len(self.raw) // self.size if self.items is None else len(self.items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Index out of range")
+        if self.items is None:
+            self.items = [None] * len(self)
+        item = self.items[index]
+        if item is None:
+            item = self.items[index] = self.type.unpack(Buffer(self.raw[index * self.size:(index + 1) * self.size]))
+            adopt(self, item)
+        return item
+
+    def __setitem__(self, index, value):
+        items = self.decode_all()
+        if isinstance(index, slice):
+            items[index] = [self.convert(x) for x in value]
+        else:
+            items[index] = self.convert(value)
+        changed(self)
+
+    def __delitem__(self, index):
+        del self.decode_all()[index]
+        changed(self)
+
+    def insert(self, index, value):
+        self.decode_all().insert(index, self.convert(value))
+        changed(self)
+
+    def convert(self, value):
+        value = value if isinstance(value, self.type) else self.type(value)
+        adopt(self, value)
+        return value
+
+    def decode_all(self):
+        # list of every item, the raw bytes no longer line up with the items once the list changes
+        for i in range(len(self)):
+            self[i]
+        return self.items
+
+    def encoded(self):
+        # the items back to back, the raw bytes as long as no item was accessed
+        if self.items is None:
+            return self.raw
+        writer = Writer()
+        self.pack_into(writer)
+        return bytes(writer)
+
+    def pack_into(self, writer: Writer):
+        if self.items is None:
+            writer.write(self.raw)
+            return
+        for i, item in enumerate(self.items):
+            if item is None:
+                writer.write(self.raw[i * self.size:(i + 1) * self.size])
+            else:
+                item.pack_into(writer)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_owner", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for item in self.items or ():
+            adopt(self, item)
+
+    # numpy views over the raw bytes, nothing is copied unless items were accessed, those are encoded again
+
+    def array(self):
+        # one row of bytes per item
+        if numpy is None:
+            raise ImportError("numpy is not installed")
+        return numpy.frombuffer(self.encoded(), numpy.uint8).reshape(len(self), self.size)
+
+    def column(self, offset: int, dtype):
+        # the value of dtype found at offset in every item, e.g. column(0, ">u4") for block numbers of item ids
+        if numpy is None:
+            raise ImportError("numpy is not installed")
+        dtype = numpy.dtype(dtype)
+        if offset < 0 or offset + dtype.itemsize > self.size:
+            raise ValueError("%s at offset %d does not fit in items of %d bytes" % (dtype, offset, self.size))
+        return numpy.ndarray((len(self),), dtype, self.encoded(), offset, (self.size,))
+
+    def records(self, dtype):
+        # one record per item, dtype is a structured dtype laid out like the encoding
+        if numpy is None:
+            raise ImportError("numpy is not installed")
+        dtype = numpy.dtype(dtype)
+        if dtype.itemsize != self.size:
+            raise ValueError("%s takes %d bytes, items take %d" % (dtype, dtype.itemsize, self.size))
+        return numpy.frombuffer(self.encoded(), dtype)
+
+
+class LazyList(Sequence):
+    # Items of a vector kept as raw slices of the wire bytes, each one is decoded the first time it is accessed.
+    # For items of a class with a hashed field the size of the bytes in front of it is recorded too, see
+    # Object.hashed.
+
+    # the LazyVector holding the list
+    _owner = None
+
+    def __init__(self, type_, raw: bytes, offsets, trusted=False, prefixes=None):
+        self.type = type_
+        self.raw = raw
+        self.offsets = offsets
+        self.items = [None] * (len(offsets) - 1)
+        self.trusted = trusted
+        self.prefixes = prefixes
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self.items)
+        item = self.items[index]
+        if item is None:
+            unpack = self.type.unpack_trusted if self.trusted else self.type.unpack
+            item = unpack(Buffer(self.raw_item(index)))
+            adopt(self, item)
+            self.items[index] = item
+        return item
+
+    def raw_item(self, index):
+        return memoryview(self.raw)[self.offsets[index]:self.offsets[index + 1]]
+
+    def raw_prefix(self, index):
+        # bytes in front of the hashed field of an item
+        start = self.offsets[index]
+        return memoryview(self.raw)[start:start + self.prefixes[index]]
+
+    def decoded(self, index):
+        return self.items[index] is not None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_owner", None)
+        state["raw"] = bytes(self.raw)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for item in self.items:
+            adopt(self, item)
+
+
+class LazyVector(Vector):
+    # Vector which only records where each item starts when unpacking, items are decoded on access.
+    # Untouched items are packed back from their raw bytes.
+
+    __slots__ = ()
+
+    def __init__(self, data):
+        if isinstance(data, LazyList):
+            self.data = data
+            data._owner = self
+            return
+        super().__init__(data)
+
+    @classmethod
+    def unpack(cls, msg: Buffer, trusted=False):
+        count = msg.read_varint()
+        start = len(msg)
+        view = msg.peek(start)
+        offsets = [0]
+        item_type = cls.types[0]
+        prefixes = None
+        if is_object(item_type) and item_type.hashed is not None:
+            skip_hashed = get_codec(item_type).skip_hashed
+            prefixes = []
+            for _ in range(count):
+                prefixes.append(skip_hashed(msg))
+                offsets.append(start - len(msg))
+        else:
+            for _ in range(count):
+                item_type.skip(msg)
+                offsets.append(start - len(msg))
+        raw = view[:offsets[-1]]
+        if not raw.readonly:
+            raw = raw.tobytes()
+        return cls(LazyList(item_type, raw, offsets, trusted, prefixes))
+
+    def pack_into(self, writer: Writer):
+        if not isinstance(self.data, LazyList):
+            super().pack_into(writer)
+            return
+        writer.write_varint(len(self.data))
+        for i in range(len(self.data)):
+            if self.data.decoded(i):
+                self.data[i].pack_into(writer)
+            else:
+                writer.write(self.data.raw_item(i))
+
 class Map(Serializable, JSONSerializable, GenericType):
-    def __init__(self, types):
+
+    __slots__ = ("data",)
+
+    @classmethod
+    def check_types(cls, types):
         if len(types) != 2:
             raise TypeError("Map should have 2 types")
-        if not all(isinstance(t, type) for t in types):
-            raise TypeError("Arguments must be types")
-        super().__init__(types)
 
     # only accepting dict at the moment
-    def __call__(self, data):
+    def __init__(self, data):
         if type(data) is not dict:
             raise TypeError("Unsupported type %s, expected dict" % type(data).__name__)
         if not all(isinstance(x, self.types[0]) for x in data.keys()):
             raise TypeError("All keys must be of type %s" % self.types[0].__name__)
         if not all(isinstance(x, self.types[1]) for x in data.values()):
             raise TypeError("All values must be of type %s" % self.types[1].__name__)
-        self.data = {}
-        for k, v in data.items():
-            self.data[k] = v
-        return self
-
-    def unpack(self, msg: Buffer):
-        obj = {}
-        count = VarInt.unpack(msg)
+        self.data = dict(data)
+        for value in self.nested():
+            adopt(self, value)
+
+    @classmethod
+    def unpack(cls, msg: Buffer, trusted=False):
+        res = new(cls)
+        res.data = {}
+        count = msg.read_varint()
+        if trusted:
+            key_unpack, value_unpack = cls.types[0].unpack_trusted, cls.types[1].unpack_trusted
+        else:
+            key_unpack, value_unpack = cls.types[0].unpack, cls.types[1].unpack
+        for _ in range(count):
+            key = key_unpack(msg)
+            res.data[key] = value_unpack(msg)
+        own = owner_setter(cls.types[1])
+        if own is not None:
+            for value in res.data.values():
+                own(value, res)
+        return res
+
+    @classmethod
+    def unpack_trusted(cls, msg: Buffer):
+        return cls.unpack(msg, True)
+
+    @classmethod
+    def skip(cls, msg: Buffer):
+        count = msg.read_varint()
         for _ in range(count):
-            key = self.types[0].unpack(msg)
-            value = self.types[1].unpack(msg)
-            obj[key] = value
-        return self(obj)
+            cls.types[0].skip(msg)
+            cls.types[1].skip(msg)
 
-    def pack(self):
-        res = VarInt(len(self.data)).pack()
+    def pack_into(self, writer: Writer):
+        writer.write_varint(len(self.data))
         for k, v in self.data.items():
-            res.extend(k.pack())
-            res.extend(v.pack())
-        return res
+            k.pack_into(writer)
+            v.pack_into(writer)
+
+    def nested(self):
+        return self.data.values()
 
     def json_object(self):
         return dict((k.json_object(), v.json_object()) for k, v in self.data.items())
 
 
 class Optional(Serializable, JSONSerializable, GenericType):
-    def __init__(self, types):
+
+    __slots__ = ("null", "data")
+
+    @classmethod
+    def check_types(cls, types):
         if len(types) != 1:
             raise TypeError("Optional should only have 1 type")
-        if not isinstance(types[0], type):
-            raise TypeError("Argument must be type")
-        super().__init__(types)
 
-    def __call__(self, data):
+    def __init__(self, data):
         if data is None:
             self.null = True
             self.data = None
@@ -127,66 +486,111 @@ class Optional(Serializable, JSONSerializable, GenericType):
                 self.data = data
             else:
                 self.data = self.types[0](data)
-        return self
-
-    def unpack(self, msg: Buffer):
-        null = ord(msg.read(1))
-        if null == 0:
-            return self(None)
+            adopt(self, self.data)
+
+    @classmethod
+    def unpack(cls, msg: Buffer, trusted=False):
+        res = new(cls)
+        res.null = msg.read_uint8() == 0
+        if res.null:
+            res.data = None
         else:
-            return self(self.types[0].unpack(msg))
+            res.data = cls.types[0].unpack_trusted(msg) if trusted else cls.types[0].unpack(msg)
+            adopt(res, res.data)
+        return res
+
+    @classmethod
+    def unpack_trusted(cls, msg: Buffer):
+        return cls.unpack(msg, True)
+
+    @classmethod
+    def skip(cls, msg: Buffer):
+        if msg.read_uint8() != 0:
+            cls.types[0].skip(msg)
 
-    def pack(self):
+    def pack_into(self, writer: Writer):
         if self.null:
-            return bytearray([0])
+            writer.write_uint8(0)
         else:
-            res = bytearray([1])
-            res.extend(self.data.pack())
-            return res
+            writer.write_uint8(1)
+            self.data.pack_into(writer)
+
+    def nested(self):
+        return () if self.null else (self.data,)
 
     def json_object(self):
         if self.null:
             return None
         return self.data.json_object()
 
+    @classmethod
+    def dump_json(cls, msg: Buffer, out: list):
+        if msg.read_uint8() == 0:
+            out.append("null")
+        else:
+            cls.types[0].dump_json(msg, out)
+
 class Extension(Serializable, JSONSerializable, GenericType):
     # extension relies on the structure definition of Object to work
-    def __init__(self, types):
+
+    __slots__ = ("data",)
+
+    @classmethod
+    def check_types(cls, types):
         if len(types) != 1:
             raise TypeError("Extension should only have 1 type")
         from objects import Object
         if not issubclass(types[0], Object):
             raise TypeError("Unsupported type %s, expected Object" % types[0])
-        super().__init__(types)
 
-    def __call__(self, data):
+    def __init__(self, data):
         if type(data) is not self.types[0]:
             raise TypeError("Unsupported type %s, expected %s" % (type(data), self.types[0]))
         self.data = data
-        return self
+        adopt(self, data)
 
-    def unpack(self, msg: Buffer):
-        definition: OrderedDict = self.types[0].definition
-        length = VarInt.unpack(msg)
+    @classmethod
+    def unpack(cls, msg: Buffer, trusted=False):
+        definition: OrderedDict = cls.types[0].definition
+        length = msg.read_varint()
         items = list(definition.items())
-        res = self.types[0]()
+        res = cls.types[0]()
+        for _ in range(length):
+            name, type_ = items[msg.read_varint()]
+            setattr(res, name, type_.unpack_trusted(msg) if trusted else type_.unpack(msg))
+        if not trusted:
+            return cls(res)
+        extension = new(cls)
+        extension.data = res
+        adopt(extension, res)
+        return extension
+
+    @classmethod
+    def unpack_trusted(cls, msg: Buffer):
+        return cls.unpack(msg, True)
+
+    @classmethod
+    def skip(cls, msg: Buffer):
+        definition: OrderedDict = cls.types[0].definition
+        length = msg.read_varint()
+        types = list(definition.values())
         for _ in range(length):
-            index = VarInt.unpack(msg)
-            setattr(res, items[index][0], items[index][1].unpack(msg))
-        return self(res)
+            types[msg.read_varint()].skip(msg)
 
-    def pack(self):
+    def pack_into(self, writer: Writer):
         definition: OrderedDict = self.types[0].definition
         values = []
         for i, item in enumerate(definition.items()):
             value = getattr(self.data, item[0], None)
             if value is not None:
                 values.append((i, value))
-        res = VarInt(len(values)).pack()
+        writer.write_varint(len(values))
         for i, v in values:
-            res.extend(VarInt(i).pack())
-            res.extend(v.pack())
-        return res
+            writer.write_varint(i)
+            v.pack_into(writer)
+
+    def nested(self):
+        return self.data,
 
     def json_object(self):
         definition: OrderedDict = self.types[0].definition
@@ -194,34 +598,124 @@ class Extension(Serializable, JSONSerializable, GenericType):
             return []
         res = {}
         for k in definition.keys():
-            v = getattr(self, k, None)
-            if v:
+            v = getattr(self.data, k, None)
+            if v is not None:
                 res[k] = v.json_object()
         return res
 
 class StaticVariant(Serializable, JSONSerializable, GenericType):
     # types take a list of possible types, there is no limit on it
-    def __init__(self, types):
-        if not all(isinstance(x, type) for x in types):
-            raise TypeError("Arguments must be types")
-        super().__init__(types)
 
-    def __call__(self, data):
+    __slots__ = ("type", "data")
+
+    # indices of the types decoded by a subclass from select(), the other values are skipped
+    selected = None
+
+    # subclasses from select(), keyed by variant and indices
+    _selections = {}
+
+    @classmethod
+    def check_types(cls, types):
+        pass
+
+    @classmethod
+    def select(cls, indices):
+        # subclass which decodes only values of the types at indices, values of the other types are kept as
+        # Skipped placeholders holding their bytes
+        selected = frozenset(indices)
+        for index in selected:
+            if not 0 <= index < len(cls.types):
+                raise IndexError("Index %d out of range for %s" % (index, cls.__name__))
+        key = cls, selected
+        res = StaticVariant._selections.get(key)
+        if res is None:
+            name = "%s.select(%s)" % (cls.__name__, ", ".join(map(str, sorted(selected))))
+            res = type(name, (cls,), {"selected": selected, "__module__": cls.__module__, "__slots__": ()})
+            res = StaticVariant._selections.setdefault(key, res)
+        return res
+
+    def __init__(self, data):
         for i, t in enumerate(self.types):
             if isinstance(data, t) or type(data) is t:
                 self.type = i
                 self.data = data
-                return self
+                adopt(self, data)
+                return
         raise TypeError(
             "%s is not in allowed types: %s" % (type(data).__name__, list(map(lambda x: x.__name__, self.types))))
 
-    def unpack(self, msg: Buffer):
-        index = VarInt.unpack(msg)
-        return self(self.types[index].unpack(msg))
+    @classmethod
+    def unpack(cls, msg: Buffer, trusted=False):
+        index = msg.read_varint()
+        res = new(cls)
+        res.type = index
+        type_ = cls.types[index]
+        if cls.selected is not None and index not in cls.selected:
+            res.data = Skipped.unpack(type_, msg)
+            return res
+        res.data = type_.unpack_trusted(msg) if trusted else type_.unpack(msg)
+        own = owner_setter(type_)
+        if own is not None:
+            own(res.data, res)
+        return res
+
+    @classmethod
+    def unpack_trusted(cls, msg: Buffer):
+        return cls.unpack(msg, True)
+
+    @classmethod
+    def skip(cls, msg: Buffer):
+        cls.types[msg.read_varint()].skip(msg)
 
-    def pack(self):
-        res = VarInt(self.type).pack()
-        res.extend(self.data.pack())
+    def pack_into(self, writer: Writer):
+        writer.write_varint(self.type)
+        self.types[self.type].pack_value_into(self.data, writer)
+
+    def nested(self):
+        return self.data,
 
     def json_object(self):
         return [self.type, self.data.json_object()]
+
+    @classmethod
+    def dump_json(cls, msg: Buffer, out: list):
+        index = msg.read_varint()
+        out.append("[%d," % index)
+        cls.types[index].dump_json(msg, out)
+        out.append("]")
+
+
+class Skipped:
+    # A value of type which was stepped over instead of decoded, it keeps the encoded bytes: a view when they are
+    # immutable and a copy otherwise. It encodes as these bytes and decode() builds the value.
+
+    __slots__ = ("type", "raw")
+
+    def __init__(self, type_, raw: bytes):
+        self.type = type_
+        self.raw = raw
+
+    @staticmethod
+    def unpack(type_, msg: Buffer):
+        view = msg.peek(len(msg))
+        type_.skip(msg)
+        raw = view[:len(view) - len(msg)]
+        return Skipped(type_, raw if raw.readonly else raw.tobytes())
+
+    def decode(self):
+        return self.type.unpack(Buffer(self.raw))
+
+    def pack_into(self, writer: Writer):
+        writer.write(self.raw)
+
+    def __getstate__(self):
+        return {"type": self.type, "raw": bytes(self.raw)}
+
+    def __setstate__(self, state):
+        self.__init__(state["type"], state["raw"])
+
+    def __repr__(self):
+        return "Skipped %s" % self.type.__name__
+
+    def json_object(self):
+        return bytes(self.raw).hex()
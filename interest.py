@@ -0,0 +1,193 @@
+from basic_types import Serializable
+from codec import fixed_size, is_object, is_object_id
+from generic_types import Vector, Optional, Map, Extension, StaticVariant
+from objectids import AccountID
+from operationimpl import SignedBlock, Transaction
+from utils import Buffer
+
+
+# Account interest filtering: the account ids in an encoded transaction are found by scanning its bytes with the
+# schema, so transactions which do not refer to any watched account are never decoded. Every AccountID field counts,
+# authorities, votes and the operations nested in proposals included.
+
+# type -> scanner, see account_scanner()
+_scanners = {}
+
+
+def has_accounts(type_, seen=None):
+    # whether values of the type can hold an AccountID
+    if seen is None:
+        seen = set()
+    if type_ in seen or not isinstance(type_, type) or not issubclass(type_, Serializable):
+        return False
+    seen.add(type_)
+    if issubclass(type_, AccountID):
+        return True
+    if is_object(type_):
+        return any(has_accounts(t, seen) for t in type_.definition.values())
+    return any(has_accounts(t, seen) for t in getattr(type_, "types", None) or ())
+
+
+def account_scanner(type_):
+    # function(msg, add) stepping over one encoded value of the type and calling add with the instance number of every
+    # AccountID in it, None when values of the type hold none. Scanners are registered before the scanners of their
+    # parts are built, the operations in proposals refer back to the operation variant.
+    if type_ in _scanners:
+        return _scanners[type_]
+    if not has_accounts(type_):
+        _scanners[type_] = None
+        return None
+    if issubclass(type_, AccountID):
+        def scan(msg, add):
+            add(msg.read_varint())
+        _scanners[type_] = scan
+    elif is_object(type_):
+        _object_scanner(type_)
+    elif issubclass(type_, Vector):
+        _vector_scanner(type_)
+    elif issubclass(type_, Optional):
+        _optional_scanner(type_)
+    elif issubclass(type_, Map):
+        _map_scanner(type_)
+    elif issubclass(type_, Extension):
+        _extension_scanner(type_)
+    elif issubclass(type_, StaticVariant):
+        _variant_scanner(type_)
+    else:
+        raise TypeError("Cannot scan %s for account ids" % type_.__name__)
+    return _scanners[type_]
+
+
+def _skipper(type_):
+    # scanner which only steps over a value
+    skip = type_.skip
+
+    def scan(msg, add):
+        skip(msg)
+    return scan
+
+
+def _object_scanner(cls):
+    # straight-line code like the codecs: fields without accounts are skipped, consecutive ones of known size at once
+    namespace = {}
+    lines = ["def scan(msg, add):"]
+    pending = 0
+    for i, (_, type_) in enumerate(cls.definition.items()):
+        size = fixed_size(type_)
+        if size is not None:
+            pending += size
+            continue
+        if pending:
+            lines.append("    msg.skip(%d)" % pending)
+            pending = 0
+        if issubclass(type_, AccountID):
+            lines.append("    add(msg.read_varint())")
+        elif is_object_id(type_):
+            lines.append("    msg.read_varint()")
+        elif has_accounts(type_):
+            namespace["t%d_scan" % i] = type_
+            lines.append("    t%d_scan(msg, add)" % i)
+        else:
+            namespace["t%d_skip" % i] = type_.skip
+            lines.append("    t%d_skip(msg)" % i)
+    if pending:
+        lines.append("    msg.skip(%d)" % pending)
+    lines.append("    return None")
+    exec(compile("\n".join(lines), "<account scanner %s>" % cls.__name__, "exec"), namespace)
+    _scanners[cls] = scan = namespace["scan"]
+    # nested scanners are bound once this one is registered
+    for name, value in list(namespace.items()):
+        if name.endswith("_scan"):
+            namespace[name] = account_scanner(value)
+    return scan
+
+
+def _vector_scanner(cls):
+    item_type = cls.types[0]
+    if issubclass(item_type, AccountID):
+        def scan(msg, add):
+            for id_ in msg.read_varints(msg.read_varint()):
+                add(id_)
+        _scanners[cls] = scan
+        return
+    item = None
+
+    def scan(msg, add):
+        for _ in range(msg.read_varint()):
+            item(msg, add)
+    _scanners[cls] = scan
+    item = account_scanner(item_type)
+
+
+def _optional_scanner(cls):
+    data = None
+
+    def scan(msg, add):
+        if msg.read_uint8() != 0:
+            data(msg, add)
+    _scanners[cls] = scan
+    data = account_scanner(cls.types[0])
+
+
+def _map_scanner(cls):
+    key = value = None
+
+    def scan(msg, add):
+        for _ in range(msg.read_varint()):
+            key(msg, add)
+            value(msg, add)
+    _scanners[cls] = scan
+    key = account_scanner(cls.types[0]) or _skipper(cls.types[0])
+    value = account_scanner(cls.types[1]) or _skipper(cls.types[1])
+
+
+def _extension_scanner(cls):
+    fields = []
+
+    def scan(msg, add):
+        for _ in range(msg.read_varint()):
+            fields[msg.read_varint()](msg, add)
+    _scanners[cls] = scan
+    fields.extend(account_scanner(t) or _skipper(t) for t in cls.types[0].definition.values())
+
+
+def _variant_scanner(cls):
+    members = []
+
+    def scan(msg, add):
+        members[msg.read_varint()](msg, add)
+    _scanners[cls] = scan
+    # placeholders for missing types, like NoneType in OperationVariant, fail like decoding them does
+    members.extend(account_scanner(t) or (_skipper(t) if issubclass(t, Serializable) else _unknown(t))
+                   for t in cls.types)
+
+
+def _unknown(type_):
+    def scan(msg, add):
+        raise TypeError("Cannot scan %s for account ids" % type_.__name__)
+    return scan
+
+
+class AccountFilter:
+    # Decodes the transactions of blocks which refer to at least one of the watched accounts, given as AccountIDs or
+    # their instance numbers.
+
+    def __init__(self, accounts):
+        self.accounts = frozenset(x.id if isinstance(x, AccountID) else x for x in accounts)
+        self.scan = account_scanner(Transaction)
+
+    def account_ids(self, msg: Buffer):
+        # instance numbers of the account ids in one encoded transaction, which is stepped over
+        res = []
+        self.scan(msg, res.append)
+        return res
+
+    def transactions(self, data):
+        # (index in block, Transaction) of every matching transaction in an encoded block
+        msg = Buffer(data)
+        msg.skip(SignedBlock.fields_size(data, "transactions"))
+        for trx_in_block in range(msg.read_varint()):
+            view = msg.peek(len(msg))
+            if self.accounts.isdisjoint(self.account_ids(msg)):
+                continue
+            yield trx_in_block, Transaction.unpack(Buffer(view[:len(view) - len(msg)]))
@@ -2,22 +2,50 @@ import datetime
 import logging
 from abc import abstractmethod
 from collections import OrderedDict
-from hashlib import sha256
 from struct import unpack
 
-from graphenebase import ecdsa
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from basic_types import (
     RIPEMD160, Uint32, String, IPAddress, Uint16, Signature, SHA256, VariantObject, IPEndpoint, Uint8, Bool, Uint64,
-    PublicKey)
-from generic_types import Vector
+    PublicKey, new)
+from generic_types import Vector, FixedList, Skipped
 from objectimpl import Address
 from objects import Object
-from operationimpl import SignedBlock, PrecomuutableTransaction
+from operationimpl import LazySignedBlock, PrecomuutableTransaction
 from utils import Buffer
 
 ItemID = RIPEMD160
 
+
+def block_numbers(item_ids: Vector):
+    # numpy array of the block numbers in a vector of block ids, stored big endian in the first 4 bytes of an id
+    if not isinstance(item_ids.data, FixedList):
+        item_ids = Vector[ItemID](FixedList(ItemID, ItemID.size, b"".join(x.data for x in item_ids.data)))
+    return item_ids.data.column(0, ">u4")
+
+# Address as a numpy record, the endpoint is the address as an int like IPAddress.address and the port
+address_dtype = None if numpy is None else numpy.dtype([
+    ("endpoint", [("address", "<u4"), ("port", "<u2")]),
+    ("last_seen_time", "<u4"),
+    ("latency", "<i8"),
+    ("node_id", "V33"),
+    ("direction", "u1"),
+    ("firewalled", "u1")
+])
+
+def address_array(addresses: Vector):
+    # structured numpy array of a vector of addresses, a view of the received bytes without an Address per item
+    if numpy is None:
+        raise ImportError("numpy is not installed")
+    if not isinstance(addresses.data, FixedList):
+        raw = b"".join(x.pack() for x in addresses.data)
+        addresses = Vector[Address](FixedList(Address, address_dtype.itemsize, raw))
+    return addresses.data.records(address_dtype)
+
 class Message(Object):
 
     @abstractmethod
@@ -27,9 +55,15 @@ class Message(Object):
     def __repr__(self):
         return type(self).__name__
 
+    @classmethod
+    def unpack_header(cls, body: bytes):
+        # the message as far as its actions read it when a DecodePool decodes the whole of it, see pool.py
+        return cls.unpack(Buffer(body))
+
 class TrxMessage(Message):
 
     message_id = 1000
+    keep_raw = True
     definition = {
         "trx": PrecomuutableTransaction
     }
@@ -41,17 +75,26 @@ class TrxMessage(Message):
 class BlockMessage(Message):
 
     message_id = 1001
+    keep_raw = True
     definition = OrderedDict([
-        ("block", SignedBlock),
+        ("block", LazySignedBlock),
         ("block_id", ItemID)
     ])
 
     def __repr__(self):
-        res = "Block %d, id %s, %d transactions" % (
-            unpack(">I", self["block_id"].data[:4])[0],
-            self["block_id"].data.hex(),
-            len(self["block"]["transactions"].data)
-        )
+        res = "Block %d, id %s" % (unpack(">I", self["block_id"].data[:4])[0], self["block_id"].data.hex())
+        if isinstance(self["block"], Skipped):
+            return res
+        return res + ", %d transactions" % len(self["block"]["transactions"].data)
+
+    @classmethod
+    def unpack_header(cls, body: bytes):
+        # only the block id, which ends the body, is decoded. The block stays a Skipped holding its bytes and raw keeps
+        # the body, so the message still packs and relays as received.
+        res = new(cls)
+        res.__dict__["raw"] = body
+        object.__setattr__(res, "block", Skipped(cls.definition["block"], memoryview(body)[:-ItemID.size]))
+        object.__setattr__(res, "block_id", ItemID(body[-ItemID.size:]))
         return res
 
 class ItemIDsInventoryMessage(Message):
@@ -117,12 +160,26 @@ class FetchItemsMessage(Message):
         elif self["item_type"].data == 1000:
             return "Fetch transaction %s" % self["items_to_fetch"].data[0].data.hex()
 
+class TypedItemID(Object):
+    # an item id along with the message type of the item, item_id in graphene
+
+    definition = OrderedDict([
+        ("item_type", Uint32),
+        ("item_hash", ItemID)
+    ])
+
 class ItemNotAvailableMessage(Message):
 
     message_id = 5005
-    definition = {
-        "requested_item": ItemID
-    }
+    definition = OrderedDict([
+        ("requested_item", TypedItemID)
+    ])
+
+    def __repr__(self):
+        item = self["requested_item"]
+        if item["item_type"].data == 1001:
+            return "Block %d not available" % unpack(">I", item["item_hash"].data[:4])[0]
+        return "Item %s not available" % item["item_hash"].data.hex()
 
 class HelloMessage(Message):
 
@@ -266,23 +323,14 @@ message_type_table = {
     5017: None,
 }
 
-fetch_target = None
+# block sync runs through the BlockSync of the connection, see sync.py
 
 def block_respond(msg: Message, conn):
-    if msg["block_id"].data == fetch_target:
-        conn.send(5003, {
-            "item_type": 1001,
-            "blockchain_synopsis": [fetch_target]
-        })
+    conn.sync.block_received(msg, conn)
 
 def item_id_inventory_respond(msg: Message, conn):
-    if msg["item_type"] == 1001:
-        global fetch_target
-        fetch_target = msg["item_hashes_available"].data[0].data
-        conn.send(5004, {
-            "item_type": 1001,
-            "items_to_fetch": [fetch_target]
-        })
+    if msg["item_type"].data == BlockMessage.message_id:
+        conn.sync.announced(msg, conn)
     else:
         conn.send(5004, {
             "item_type": 1000,
@@ -290,14 +338,11 @@ def item_id_inventory_respond(msg: Message, conn):
         })
 
 def blockchain_item_id_inventory_respond(msg: Message, conn):
-    global fetch_target
-    if fetch_target == msg["item_hashes_available"].data[-1].data:
-        return
-    conn.send(5004, {
-        "item_type": 1001,
-        "items_to_fetch": msg["item_hashes_available"].data
-    })
-    fetch_target = msg["item_hashes_available"].data[-1].data
+    conn.sync.inventory_received(msg, conn)
+
+def item_not_available_respond(msg: Message, conn):
+    if msg["requested_item"]["item_type"].data == BlockMessage.message_id:
+        conn.sync.item_not_available(msg, conn)
 
 def fetch_item_id_respond(_, conn):
     conn.send(5002, {
@@ -307,13 +352,8 @@ def fetch_item_id_respond(_, conn):
     })
 
 def hello_respond(msg: Message, conn):
-    key = ecdsa.recover_public_key(
-              sha256(conn.shared_secret).digest(),
-              msg["signed_shared_secret"].data[1:],
-              0 if msg["signed_shared_secret"].data[0] == 31 else 1
-          )
-    res = bytes([3] if key.to_string()[63] % 2 == 1 else [2]) + key.to_string()[:32]
-    if repr(msg["node_public_key"].data) == res.hex():
+    key = conn.crypto.recover_compact(conn.shared_secret, msg["signed_shared_secret"].data)
+    if msg["node_public_key"].raw == key:
         conn.send(5007, {})
         conn.send(5009, {})
 
@@ -327,10 +367,7 @@ def address_respond(_, conn):
     conn.send(5012, {
         "request_sent_time": int(now.timestamp() * 1000000)
     })
-    conn.send(5003, {
-        "item_type": 1001,
-        "blockchain_synopsis": ["02773f092a07e75c930921dc20e8edc7ab85b887"]
-    })
+    conn.sync.start(conn)
 
 
 def time_request_respond(msg: Message, conn):
@@ -346,24 +383,39 @@ message_action_table = {
     5001: item_id_inventory_respond,
     5002: blockchain_item_id_inventory_respond,
     5003: fetch_item_id_respond,
+    5005: item_not_available_respond,
     5006: hello_respond,
     5009: address_request_respond,
     5010: address_respond,
     5012: time_request_respond,
 }
 
-def parse_message(msg: bytes, conn, dir_):
+def frame_body(msg: bytes):
+    # message type and body of a decrypted frame, without the header and padding
     size = unpack("<I", msg[:4])[0]
     msg_type = unpack("<I", msg[4:8])[0]
-    message_type = message_type_table[msg_type]
-    end = -(len(msg) - size - 8)
-    if end == 0:
-        end = None
-    msg = msg[8:end]
-    buf = Buffer()
-    buf.write(msg)
-    message = message_type.unpack(buf)
-    logging.info(("\033[36mSEND >>> \033[0m" if dir_ == 1 else "\033[32mRECV <<< \033[0m") + repr(message))
-    action = message_action_table.get(msg_type, None)
+    # decoded objects keep views of the bytes instead of copies, so they must not change under them
+    return msg_type, bytes(msg[8:8 + size])
+
+
+def decode_message(msg_type: int, body: bytes):
+    return message_type_table[msg_type].unpack(Buffer(body))
+
+
+def decode_header(msg_type: int, body: bytes):
+    return message_type_table[msg_type].unpack_header(body)
+
+
+def dispatch_message(msg_type: int, message, conn, actions=None):
+    if actions is None:
+        actions = message_action_table
+    action = actions.get(msg_type, None)
     if action is not None and conn is not None:
-        action(message, conn)
\ No newline at end of file
+        action(message, conn)
+
+
+def parse_message(msg: bytes, conn, dir_, actions=None):
+    msg_type, body = frame_body(msg)
+    message = decode_message(msg_type, body)
+    logging.info("%s%s", "\033[36mSEND >>> \033[0m" if dir_ == 1 else "\033[32mRECV <<< \033[0m", message)
+    dispatch_message(msg_type, message, conn, actions)
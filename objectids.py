@@ -1,19 +1,45 @@
 from abc import ABCMeta, abstractmethod
-from struct import unpack
+from functools import lru_cache
 
-from basic_types import Serializable, VarInt, JSONSerializable
-from utils import Buffer
+from basic_types import Serializable, VarInt, JSONSerializable, new
+from utils import Buffer, Writer
 
 
 class ObjectID(Serializable, JSONSerializable, metaclass=ABCMeta):
+    # Ids equal when their class and instance number do. Decoded ids are shared, so the instance number cannot be
+    # changed.
+
+    __slots__ = ("id",)
 
     def __init__(self, data):
         if type(data) is VarInt:
-            self.id = data.data
-            return
-        if type(data) is not int:
+            data = data.data
+        elif type(data) is not int:
             raise TypeError("Unsupported type %s, expected int" % type(data).__name__)
-        self.id = data
+        _set_id(self, data)
+
+    # flyweight table of the decoded ids, keyed by (class, instance number)
+    @classmethod
+    @lru_cache(maxsize=1 << 16)
+    def intern(cls, id_: int):
+        res = new(cls)
+        _set_id(res, id_)
+        return res
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is read-only" % type(self).__name__)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.id == other.id
+
+    def __hash__(self):
+        # noinspection PyUnresolvedReferences
+        return hash((self.space, self.type, self.id))
+
+    def __reduce__(self):
+        return type(self).intern, (self.id,)
 
     @abstractmethod
     def space(self):
@@ -25,99 +51,142 @@ class ObjectID(Serializable, JSONSerializable, metaclass=ABCMeta):
 
     @classmethod
     def unpack(cls, msg: Buffer):
-        return cls(VarInt.unpack(msg))
+        return cls.intern(msg.read_varint())
 
-    def pack(self):
-        return VarInt(self.id).pack()
+    @staticmethod
+    def skip(msg: Buffer):
+        msg.read_varint()
+
+    def pack_into(self, writer: Writer):
+        writer.write_varint(self.id)
 
     def json_object(self):
         # noinspection PyStringFormat,PyUnresolvedReferences
         return "%d.%d.%d" % (self.space, self.type, self.id)
 
+    @classmethod
+    def dump_json(cls, msg: Buffer, out: list):
+        # noinspection PyStringFormat
+        out.append('"%d.%d.%d"' % (cls.space, cls.type, msg.read_varint()))
+
+_set_id = ObjectID.id.__set__
+
 
 class FullObjectID(Serializable, metaclass=ABCMeta):
 
+    __slots__ = ()
+
     # noinspection PyMethodOverriding
     @staticmethod
     def unpack(msg: Buffer):
-        data = unpack("<Q", msg.read(8))[0]
+        data = msg.read_uint64()
         type_ = (data & (0xff << 48)) >> 48
         id_ = data & 0xffffffffffff
-        return FullObjectID.oid_types[type_](id_)
+        return FullObjectID.oid_types[type_].intern(id_)
+
+    @staticmethod
+    def skip(msg: Buffer):
+        msg.skip(8)
+
+    @staticmethod
+    def dump_json(msg: Buffer, out: list):
+        out.append('"%s"' % FullObjectID.unpack(msg).json_object())
+
+    # values are the specific object id classes, which encode themselves as varints, so encoding in the full form
+    # goes through the declared type
+    # noinspection PyMethodOverriding
+    @staticmethod
+    def pack_value_into(value, writer: Writer):
+        writer.write_uint64(value.space << 56 | value.type << 48 | value.id)
 
 
 class AccountID(ObjectID, FullObjectID):
 
+    __slots__ = ()
     space = 1
     type = 2
 
 class AssetID(ObjectID, FullObjectID):
 
+    __slots__ = ()
     space = 1
     type = 3
 
 class ForceSettlementID(ObjectID, FullObjectID):
 
+    __slots__ = ()
     space = 1
     type = 4
 
 class CommitteeMemberID(ObjectID, FullObjectID):
 
+    __slots__ = ()
     space = 1
     type = 5
 
 class WitnessID(ObjectID, FullObjectID):
 
+    __slots__ = ()
     space = 1
     type = 6
 
 class LimitOrderID(ObjectID, FullObjectID):
 
+    __slots__ = ()
     space = 1
     type = 7
 
 class CallOrderID(ObjectID, FullObjectID):
 
+    __slots__ = ()
     space = 1
     type = 8
 
 class CustomID(ObjectID, FullObjectID):
 
+    __slots__ = ()
     space = 1
     type = 9
 
 class ProposalID(ObjectID, FullObjectID):
 
+    __slots__ = ()
     space = 1
     type = 10
 
 class OperationHistoryID(ObjectID, FullObjectID):
 
+    __slots__ = ()
     space = 1
     type = 11
 
 class WithdrawPermissionID(ObjectID, FullObjectID):
 
+    __slots__ = ()
     space = 1
     type = 12
 
 class VestingBalanceID(ObjectID, FullObjectID):
 
+    __slots__ = ()
     space = 1
     type = 13
 
 class WorkerID(ObjectID, FullObjectID):
 
+    __slots__ = ()
     space = 1
     type = 14
 
 class BalanceID(ObjectID, FullObjectID):
 
+    __slots__ = ()
     space = 1
     type = 15
 
 class HTLCID(ObjectID, FullObjectID):
 
+    __slots__ = ()
     space = 1
     type = 16
 
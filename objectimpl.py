@@ -179,9 +179,9 @@ class AssetSymbolEqLitPredicate(Object):
 
 class BlockIDPredicate(Object):
 
-    definition = {
-        "id", RIPEMD160
-    }
+    definition = OrderedDict([
+        ("id", RIPEMD160)
+    ])
 
 Predicate = StaticVariant[
     AccountNameEqLitPredicate,
@@ -1,12 +1,46 @@
 from abc import ABCMeta, abstractmethod
 
 from basic_types import (
-    Serializable, JSONSerializable)
-from utils import Buffer
+    Serializable, JSONSerializable, adopt, changed)
+from codec import get_codec
+from utils import Buffer, Writer
+
+
+class ObjectMeta(ABCMeta):
+    # Fields are kept in __slots__ generated from the definition of each class, so decoded objects have no __dict__.
+    # Classes which keep raw still get one, for raw and what is computed from it. Classes with a hashed field get
+    # slots for the bytes in front of it and the id computed from them.
+
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        if "__slots__" not in namespace:
+            inherited = {x for base in bases for cls in base.__mro__ for x in cls.__dict__.get("__slots__", ())}
+            definition = namespace.get("definition")
+            slots = [x for x in definition if x not in inherited] if isinstance(definition, dict) else []
+            keep_raw = namespace.get("keep_raw", any(getattr(base, "keep_raw", False) for base in bases))
+            if keep_raw and not any(base.__dictoffset__ for base in bases):
+                slots.append("__dict__")
+            hashed = namespace.get("hashed", any(getattr(base, "hashed", None) for base in bases))
+            if hashed:
+                slots.extend(x for x in ("_prefix", "_id") if x not in inherited)
+            namespace["__slots__"] = tuple(slots)
+        return super().__new__(mcs, name, bases, namespace, **kwargs)
 
 
 # noinspection PyUnresolvedReferences
-class Object(Serializable, JSONSerializable, metaclass=ABCMeta):
+class Object(Serializable, JSONSerializable, metaclass=ObjectMeta):
+
+    # Classes with keep_raw set keep the bytes they were decoded from in raw, pack() then writes them back as they
+    # are, e.g. to relay a message. raw is a view when the decoded bytes are immutable and a copy otherwise. Assigning
+    # a field of the object or of any object nested in it drops raw, see basic_types.changed(). Other changes in place,
+    # e.g. to the list of a Vector, are not seen, call invalidate() on the object holding the container after those.
+    keep_raw = False
+    raw = None
+
+    # Classes which have an id hashed from the encoding of the fields in front of the field named by hashed keep those
+    # bytes when decoded, the same way as raw, and remember the id once computed. Both are dropped along with raw.
+    hashed = None
+
+    __slots__ = ("_owner",)
 
     def __init__(self, *args):
         if len(args) > 1:
@@ -14,28 +48,93 @@ class Object(Serializable, JSONSerializable, metaclass=ABCMeta):
         if len(args) == 1:
             if type(args[0]) is not dict:
                 raise TypeError("Unsupported type %s, expected dict" % type(args[0]).__name__)
-            self.__dict__.update(args[0])
+            for name, value in args[0].items():
+                object.__setattr__(self, name, value)
+                adopt(self, value)
 
     @abstractmethod
     def definition(self):
         pass
 
+    # decoding and encoding run through code generated from the definition, see codec.py
+
+    # trusted skips the checks of the field values, see Serializable.unpack_trusted()
+    @classmethod
+    def unpack(cls, msg: Buffer, trusted=False):
+        codec = get_codec(cls)
+        unpack = codec.unpack_trusted if trusted else codec.unpack
+        if not cls.keep_raw:
+            return unpack(msg)
+        view = msg.peek(len(msg))
+        res = unpack(msg)
+        raw = view[:len(view) - len(msg)]
+        res.__dict__["raw"] = raw if raw.readonly else raw.tobytes()
+        return res
+
+    @classmethod
+    def unpack_trusted(cls, msg: Buffer):
+        if not cls.keep_raw:
+            return get_codec(cls).unpack_trusted(msg)
+        return cls.unpack(msg, True)
+
+    def pack_into(self, writer: Writer):
+        if self.raw is not None:
+            writer.write(self.raw)
+            return
+        get_codec(type(self)).pack_into(self, writer)
+
+    @classmethod
+    def skip(cls, msg: Buffer):
+        get_codec(cls).skip(msg)
+
+    @classmethod
+    def dump_json(cls, msg: Buffer, out: list):
+        get_codec(cls).dump_json(msg, out)
+
+    def encoded(self):
+        # wire bytes of the object, encoded again only when they were not kept
+        return self.raw if self.raw is not None else self.pack()
+
+    @classmethod
+    def fields_size(cls, data, name):
+        # number of bytes the fields in front of field name take at the start of encoded data
+        msg = Buffer(data)
+        for field, type_ in cls.definition.items():
+            if field == name:
+                return len(data) - len(msg)
+            type_.skip(msg)
+        raise KeyError(name)
+
+    def fields_encoded(self, name):
+        # wire bytes of the fields in front of field name
+        if self.raw is not None:
+            return self.raw[:self.fields_size(self.raw, name)]
+        if name == self.hashed:
+            prefix = getattr(self, "_prefix", None)
+            if prefix is not None:
+                return prefix
+        writer = Writer()
+        for field, type_ in self.definition.items():
+            if field == name:
+                return bytes(writer)
+            value = getattr(self, field)
+            (value if type(value) is type_ else type_(value)).pack_into(writer)
+        raise KeyError(name)
+
     @classmethod
-    def unpack(cls, msg: Buffer):
+    def unpack_interpreted(cls, msg: Buffer):
         res = cls()
         for name, type_ in cls.definition.items():
             setattr(res, name, type_.unpack(msg))
         return res
 
-    def pack(self):
-        res = bytearray()
+    def pack_into_interpreted(self, writer: Writer):
         for name, type_ in self.definition.items():
             value = getattr(self, name)
             if type(value) is type_:
-                res.extend(value.pack())
+                value.pack_into(writer)
             else:
-                res.extend(type_(value).pack())
-        return res
+                type_(value).pack_into(writer)
 
     def __getitem__(self, item):
         return getattr(self, item)
@@ -43,6 +142,55 @@ class Object(Serializable, JSONSerializable, metaclass=ABCMeta):
     def __setitem__(self, item, value):
         return setattr(self, item, value)
 
+    def __setattr__(self, name, value):
+        if name == "raw" or name in self.definition:
+            self.invalidate()
+            if name == "raw" and value is None:
+                return
+            adopt(self, value)
+        object.__setattr__(self, name, value)
+
+    def invalidate(self):
+        # drops the kept bytes of this object and of the objects it is nested in, so pack() encodes the values again
+        changed(self)
+
+    def drop_encoding(self):
+        fields = getattr(self, "__dict__", None)
+        if fields:
+            fields.pop("raw", None)
+        if self.hashed is not None:
+            object.__setattr__(self, "_prefix", None)
+            object.__setattr__(self, "_id", None)
+
+    def memoized_id(self, hash_id):
+        # id computed by hash_id from the bytes in front of the hashed field, kept until a field changes
+        id_ = getattr(self, "_id", None)
+        if id_ is None:
+            id_ = hash_id(self.fields_encoded(self.hashed))
+            object.__setattr__(self, "_id", id_)
+        return id_
+
+    def __getstate__(self):
+        state = {}
+        for name in self.definition:
+            try:
+                state[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        state.update(getattr(self, "__dict__", ()))
+        if self.hashed is not None:
+            state["_prefix"] = getattr(self, "_prefix", None)
+            state["_id"] = getattr(self, "_id", None)
+        for name in ("raw", "_prefix"):
+            if isinstance(state.get(name), memoryview):
+                state[name] = state[name].tobytes()
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+            adopt(self, value)
+
     def __repr__(self):
         return type(self).__name__
 
@@ -1,9 +1,11 @@
 
 from collections import OrderedDict
+from hashlib import sha224, sha256
+from struct import Struct
 
 from basic_types import Uint16, Uint32, Signature, Null, RIPEMD160, VariantObject, Bool, String, Uint8, Int64, \
     PublicKey, Data, SHA256
-from generic_types import Optional, Extension, StaticVariant, Vector
+from generic_types import Optional, Extension, StaticVariant, Vector, LazyVector, LazyList
 from objectids import AccountID, FullObjectID, WitnessID, LimitOrderID, AssetID, ProposalID, VestingBalanceID, \
     WithdrawPermissionID, CommitteeMemberID, HTLCID
 from objectimpl import Asset, Memo, EmptyExtension, CallOrderOptions, Authority, AccountOptions, AssetOptions, \
@@ -78,7 +80,7 @@ class AccountUpdateOperation(Operation):
     opid = 6
     definition = OrderedDict([
         ("fee", Asset),
-        ("account", LimitOrderID),
+        ("account", AccountID),
         ("owner", Optional[Authority]),
         ("active", Optional[Authority]),
         ("new_options", Optional[AccountOptions]),
@@ -254,7 +256,8 @@ class ProposalCreateOperation(Operation):
 
     opid = 22
     definition = {}
-    # Late declaration of definition
+    # Late declaration of definition, the fields are not known in time for slots
+    __slots__ = ("__dict__",)
     
 class ProposalUpdateOperation(Operation):
     
@@ -356,7 +359,8 @@ class CommitteeMemberUpdateGlobalParametersOperation(Operation):
 
     opid = 31
     definition = {}
-    # Late declaration of definition
+    # Late declaration of definition, the fields are not known in time for slots
+    __slots__ = ("__dict__",)
 
 class VestingBalanceCreateOperation(Operation):
     
@@ -667,6 +671,18 @@ CommitteeMemberUpdateGlobalParametersOperation.definition = OrderedDict([
     ("new_parameters", ChainParameters)
 ])
 
+block_number_struct = Struct(">I")
+
+
+def block_number(block_id: bytes):
+    return block_number_struct.unpack_from(block_id)[0]
+
+
+def transaction_id(unsigned):
+    # the first 20 bytes of the sha256 of a transaction without its signatures
+    return RIPEMD160(sha256(unsigned).digest()[:20])
+
+
 class PrecomuutableTransaction(Object):
     definition = OrderedDict([
         ("ref_block_num", Uint16),
@@ -676,6 +692,10 @@ class PrecomuutableTransaction(Object):
         ("extensions", Extension[EmptyExtension]),
         ("signatures", Vector[Signature])
     ])
+    hashed = "signatures"
+
+    def id(self):
+        return self.memoized_id(transaction_id)
 
 
 OpResult = StaticVariant[Null, FullObjectID, Asset]
@@ -691,6 +711,10 @@ class Transaction(Object):
         ("signatures", Vector[Signature]),
         ("operation_results", Vector[OpResult])
     ])
+    hashed = "signatures"
+
+    def id(self):
+        return self.memoized_id(transaction_id)
 
 
 class SignedBlock(Object):
@@ -703,5 +727,56 @@ class SignedBlock(Object):
         ("witness_signature", Signature),
         ("transactions", Vector[Transaction])
     ])
-
-
+    hashed = "transactions"
+
+    def number(self):
+        # block numbers are stored big endian in the first 4 bytes of a block id
+        return block_number(self.previous.data) + 1
+
+    def id(self):
+        return self.memoized_id(self.block_id)
+
+    def block_id(self, header):
+        # sha224 of the signed header with its first 4 bytes replaced by the block number, cut to 20 bytes
+        return RIPEMD160(block_number_struct.pack(self.number()) + sha224(header).digest()[4:20])
+
+    def transaction_ids(self):
+        # ids of all transactions in the block, transactions a lazy block has not decoded yet are hashed straight from
+        # the bytes recorded while skipping them
+        transactions = self.transactions.data
+        if not isinstance(transactions, LazyList):
+            return [trx.id() for trx in transactions]
+        return [transactions[i].id() if transactions.decoded(i) else transaction_id(transactions.raw_prefix(i))
+                for i in range(len(transactions))]
+
+
+class LazySignedBlock(SignedBlock):
+    # header fields are decoded right away, transactions only when accessed
+    definition = OrderedDict(SignedBlock.definition, transactions=LazyVector[Transaction])
+
+
+class OperationSelection:
+    # Transaction and block types which decode only the operations with the given opids, the other operations are
+    # stepped over and kept as Skipped placeholders along with their opid. Selections are cached per set of opids.
+
+    _cache = {}
+
+    def __new__(cls, opids):
+        opids = frozenset(opids)
+        res = OperationSelection._cache.get(opids)
+        if res is None:
+            res = super().__new__(cls)
+            res.opids = opids
+            res.variant = OperationVariant.select(opids)
+            suffix = "[%s]" % ", ".join(map(str, sorted(opids)))
+            res.transaction = type("SelectedTransaction" + suffix, (Transaction,), {
+                "definition": OrderedDict(Transaction.definition, operations=Vector[res.variant]),
+                "__module__": __name__})
+            res.block = type("SelectedSignedBlock" + suffix, (SignedBlock,), {
+                "definition": OrderedDict(SignedBlock.definition, transactions=Vector[res.transaction]),
+                "__module__": __name__})
+            res.lazy_block = type("SelectedLazySignedBlock" + suffix, (LazySignedBlock,), {
+                "definition": OrderedDict(SignedBlock.definition, transactions=LazyVector[res.transaction]),
+                "__module__": __name__})
+            res = OperationSelection._cache.setdefault(opids, res)
+        return res
@@ -0,0 +1,39 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from messages import BlockMessage, decode_message
+
+
+# Decoding of large messages in worker processes, so decoding blocks during a sync is not capped at one core.
+# A worker decodes the message and hands it to process(message), a picklable function, only its result is sent back:
+# decoded object trees take longer to unpickle than to decode from the wire bytes again. A PeerProtocol with a pool
+# passes those results to its on_result callback in the order the messages were received. Its actions get the messages
+# as far as Message.unpack_header() decodes them on the receiving side, block messages with only their block id.
+
+
+def _decode(process, msg_type: int, body: bytes):
+    return process(decode_message(msg_type, body))
+
+
+class DecodePool:
+
+    def __init__(self, process, workers=None, message_types=(BlockMessage.message_id,)):
+        self.process = process
+        self.workers = os.cpu_count() if workers is None else workers
+        if self.workers < 1:
+            raise ValueError("DecodePool needs at least 1 worker")
+        self.message_types = frozenset(message_types)
+        self.executor = ProcessPoolExecutor(self.workers)
+
+    def submit(self, msg_type: int, body: bytes):
+        # concurrent.futures.Future of the processed message
+        return self.executor.submit(_decode, self.process, msg_type, body)
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from messages import BlockMessage, FetchBlockchainItemIDsMessage, FetchItemsMessage
+
+
+# Pipelined block download from one peer. Block ids come in inventories, the replies to fetch blockchain item ids
+# messages, and the blocks themselves are requested by fetch items messages of a batch of ids each, up to a window of
+# them in flight at once. The next inventory is requested while the blocks of the current one still arrive, so the
+# link does not sit idle for a round trip between them. The window grows while that raises the block rate and
+# shrinks when it stops doing so.
+# Blocks the peer reports as not available, and those of a batch which made no progress for timeout seconds, are
+# requested again up to retries times and listed in missing after that. An inventory request which is not answered
+# in time is sent again, after retries of them the sync fails with a TimeoutError.
+
+# block a sync starts after unless it is given another one
+START_BLOCK = "02773f092a07e75c930921dc20e8edc7ab85b887"
+
+
+class Batch:
+    # the ids of a fetch items message whose blocks did not arrive yet, when the last of its blocks did and the timer
+    # which checks on it
+
+    __slots__ = ("ids", "last", "timer")
+
+    def __init__(self, ids):
+        self.ids = dict.fromkeys(ids)
+        self.last = time.perf_counter()
+        self.timer = None
+
+
+class BlockSync:
+
+    def __init__(self, start=START_BLOCK, batch=100, window=4, max_window=64, on_block=None, timeout=30, retries=2):
+        if batch < 1 or window < 1 or max_window < window:
+            raise ValueError("BlockSync needs a batch and window of at least 1, up to max_window")
+        if timeout <= 0 or retries < 0:
+            raise ValueError("BlockSync needs a positive timeout and no negative retries")
+        self.batch = batch
+        self.window = window
+        self.max_window = max_window
+        self.timeout = timeout
+        self.retries = retries
+        # called with every BlockMessage which arrives, with a decode pool its block is still a Skipped, see pool.py
+        self.on_block = on_block
+        # id of the last block known from an inventory, the synopsis of the next inventory request
+        self.last_known = bytes.fromhex(start) if isinstance(start, str) else bytes(start)
+        # ids known from inventories which are not requested yet
+        self.pending = deque()
+        # requested block id -> its Batch
+        self.requested = {}
+        self.in_flight = 0
+        # block id -> times it was requested again, and the ids given up on
+        self.attempts = {}
+        self.missing = []
+        self.inventory_requested = False
+        self.inventory_timer = None
+        self.inventory_attempts = 0
+        # the last inventory had no new ids
+        self.exhausted = False
+        self.blocks = 0
+        self.started = None
+        self.last_block = None
+        # window adaption: block count and time when the current measurement started, rate of the previous one, the
+        # direction the window moves in and whether it still doubles
+        self.round_blocks = 0
+        self.round_start = None
+        self.round_batches = 0
+        self.rate = None
+        self.step = 1
+        self.doubling = True
+        self.finished = None
+
+    def start(self, conn):
+        self.started = self.round_start = time.perf_counter()
+        self.finished = asyncio.get_running_loop().create_future()
+        self.request_inventory(conn)
+
+    def blocks_per_second(self):
+        if self.last_block is None:
+            return 0.0
+        return self.blocks / (self.last_block - self.started)
+
+    def request_inventory(self, conn):
+        if self.inventory_requested:
+            return
+        self.inventory_requested = True
+        self.inventory_timer = asyncio.get_running_loop().call_later(self.timeout, self.inventory_expired, conn)
+        conn.send(FetchBlockchainItemIDsMessage.message_id, {
+            "item_type": BlockMessage.message_id,
+            "blockchain_synopsis": [self.last_known]
+        })
+
+    def inventory_expired(self, conn):
+        self.inventory_requested = False
+        self.inventory_timer = None
+        self.inventory_attempts += 1
+        if self.inventory_attempts > self.retries:
+            logging.error("No inventory after %d requests, giving up", self.inventory_attempts)
+            if self.finished is not None and not self.finished.done():
+                self.finished.set_exception(TimeoutError("Peer did not answer %d inventory requests" %
+                                                         self.inventory_attempts))
+            return
+        logging.warning("Inventory request timed out, requesting it again")
+        self.request_inventory(conn)
+
+    def inventory_received(self, msg, conn):
+        if self.inventory_timer is not None:
+            self.inventory_timer.cancel()
+            self.inventory_timer = None
+        self.inventory_requested = False
+        self.inventory_attempts = 0
+        ids = [x.data for x in msg["item_hashes_available"].data]
+        # a reply starts with the block of the synopsis
+        if ids and ids[0] == self.last_known:
+            del ids[0]
+        self.exhausted = not ids
+        if ids:
+            self.last_known = ids[-1]
+            self.pending.extend(ids)
+        self.fill(conn)
+
+    def announced(self, msg, conn):
+        # new blocks announced by the peer are fetched through an inventory after the last known block
+        self.exhausted = False
+        if self.started is None:
+            self.start(conn)
+        else:
+            self.fill(conn)
+
+    def block_received(self, msg, conn):
+        self.blocks += 1
+        self.last_block = time.perf_counter()
+        if self.on_block is not None:
+            self.on_block(msg)
+        id_ = msg["block_id"].data
+        batch = self.requested.pop(id_, None)
+        if batch is None:
+            return
+        self.attempts.pop(id_, None)
+        batch.last = self.last_block
+        if self.settle(batch, id_):
+            self.adapt()
+            self.fill(conn)
+
+    def item_not_available(self, msg, conn):
+        id_ = msg["requested_item"]["item_hash"].data
+        batch = self.requested.pop(id_, None)
+        if batch is None:
+            return
+        logging.warning("Block %s not available", id_.hex())
+        self.retry([id_])
+        if self.settle(batch, id_):
+            self.fill(conn)
+
+    def settle(self, batch, id_):
+        # takes id_ off its batch, returns whether that was the last one
+        del batch.ids[id_]
+        if batch.ids:
+            return False
+        batch.timer.cancel()
+        self.in_flight -= 1
+        return True
+
+    def retry(self, ids):
+        # queues ids to be requested first, or lists them in missing once they were requested again retries times
+        again = []
+        for id_ in ids:
+            attempts = self.attempts.pop(id_, 0)
+            if attempts < self.retries:
+                self.attempts[id_] = attempts + 1
+                again.append(id_)
+            else:
+                self.missing.append(id_)
+        self.pending.extendleft(reversed(again))
+
+    def expire(self, batch, conn):
+        # the blocks left of a batch are given up on once none of them arrived for timeout seconds
+        remaining = batch.last + self.timeout - time.perf_counter()
+        if remaining > 0:
+            batch.timer = asyncio.get_running_loop().call_later(remaining, self.expire, batch, conn)
+            return
+        ids = list(batch.ids)
+        logging.warning("%d blocks not received in %s seconds", len(ids), self.timeout)
+        for id_ in ids:
+            del self.requested[id_]
+        batch.ids.clear()
+        self.in_flight -= 1
+        # the peer or the link may be overloaded
+        self.window = max(1, self.window // 2)
+        self.doubling = False
+        self.retry(ids)
+        self.fill(conn)
+
+    def fill(self, conn):
+        # requests batches up to the window, and the next inventory once fewer ids than a window takes are left
+        while self.in_flight < self.window and self.pending:
+            ids = [self.pending.popleft() for _ in range(min(self.batch, len(self.pending)))]
+            batch = Batch(ids)
+            for id_ in ids:
+                self.requested[id_] = batch
+            batch.timer = asyncio.get_running_loop().call_later(self.timeout, self.expire, batch, conn)
+            self.in_flight += 1
+            conn.send(FetchItemsMessage.message_id, {
+                "item_type": BlockMessage.message_id,
+                "items_to_fetch": ids
+            })
+        if not self.exhausted and len(self.pending) < self.window * self.batch:
+            self.request_inventory(conn)
+        elif self.exhausted and not self.in_flight and not self.pending and not self.inventory_requested:
+            logging.info("Synced %d blocks, %.1f blocks/s", self.blocks, self.blocks_per_second())
+            if self.missing:
+                logging.warning("%d blocks missing", len(self.missing))
+            if self.finished is not None and not self.finished.done():
+                self.finished.set_result(self.blocks)
+
+    def adapt(self):
+        # the rate is measured over a window worth of batches. The window doubles until the rate stops rising by at
+        # least 5%, from then on it moves by one, the same way while the rate rises and turning around otherwise.
+        self.round_batches += 1
+        if self.round_batches < self.window:
+            return
+        now = time.perf_counter()
+        rate = (self.blocks - self.round_blocks) / (now - self.round_start)
+        if self.rate is not None and rate < self.rate * 1.05:
+            self.step = -self.step
+            self.doubling = False
+        self.rate = rate
+        if self.doubling:
+            self.window = min(self.max_window, self.window * 2)
+        else:
+            self.window = max(1, min(self.max_window, self.window + self.step))
+        self.round_blocks = self.blocks
+        self.round_start = now
+        self.round_batches = 0
@@ -0,0 +1,105 @@
+import pickle
+import unittest
+
+from fixtures import block_bytes
+from messages import BlockMessage
+from operationimpl import SignedBlock, Transaction
+from utils import Buffer
+
+
+class NestedChangeTest(unittest.TestCase):
+    # pack() and id() follow changes nested in the fields of a decoded value
+
+    def setUp(self):
+        self.data = block_bytes(16 * 1024)
+
+    def test_transaction(self):
+        trx = SignedBlock.unpack(Buffer(self.data)).transactions.data[0]
+        packed, id_ = trx.pack(), trx.id()
+        trx.operations.data[0].data.fee.amount = 1
+        self.assertNotEqual(trx.pack(), packed)
+        self.assertNotEqual(trx.id(), id_)
+        again = Transaction.unpack(Buffer(trx.pack()))
+        self.assertEqual(again.operations.data[0].data.fee.amount.data, 1)
+        self.assertEqual(again.id(), trx.id())
+
+    def test_block(self):
+        block = SignedBlock.unpack(Buffer(self.data))
+        packed, id_, transaction_ids = block.pack(), block.id(), block.transaction_ids()
+        block.transactions.data[0].expiration = 1
+        self.assertNotEqual(block.pack(), packed)
+        # the block id covers the header only
+        self.assertEqual(block.id(), id_)
+        self.assertNotEqual(block.transaction_ids()[0], transaction_ids[0])
+        self.assertEqual(block.transaction_ids()[1:], transaction_ids[1:])
+        self.assertEqual(SignedBlock.unpack(Buffer(block.pack())).transaction_ids(), block.transaction_ids())
+
+    def test_lazy_block(self):
+        block = BlockMessage.unpack(Buffer(self.data)).block
+        packed, transaction_ids = block.pack(), block.transaction_ids()
+        block.transactions.data[0].operations.data[0].data.fee.amount = 1
+        self.assertNotEqual(block.pack(), packed)
+        self.assertNotEqual(block.transaction_ids()[0], transaction_ids[0])
+        self.assertEqual(block.transaction_ids()[1:], transaction_ids[1:])
+
+    def test_ids(self):
+        # ids hashed from the received bytes match those of the values encoded again and are remembered
+        block = SignedBlock.unpack(Buffer(self.data))
+        ids = block.id(), block.transaction_ids()
+        self.assertIs(block.id(), ids[0])
+        self.assertIs(block.transactions.data[0].id(), ids[1][0])
+        lazy = BlockMessage.unpack(Buffer(self.data)).block
+        lazy.transactions.data[1]
+        self.assertEqual((lazy.id(), lazy.transaction_ids()), ids)
+        for trx in block.transactions.data:
+            trx.invalidate()
+        self.assertEqual((block.id(), block.transaction_ids()), ids)
+
+    def test_message(self):
+        # relayed messages send the received bytes until a field nested in them changes
+        message = BlockMessage.unpack(Buffer(self.data))
+        self.assertEqual(message.pack(), self.data)
+        message.block.transactions.data[0].expiration = 1
+        self.assertIsNone(message.raw)
+        changed = message.pack()
+        self.assertNotEqual(changed, self.data)
+        self.assertEqual(BlockMessage.unpack(Buffer(changed)).block.transactions.data[0].expiration.data, 1)
+
+    def test_deep_change(self):
+        message = BlockMessage.unpack(Buffer(self.data))
+        message.block.transactions.data[1].operations.data[0].data.fee.amount = 1
+        self.assertIsNone(message.raw)
+        changed = BlockMessage.unpack(Buffer(message.pack()))
+        self.assertEqual(changed.block.transactions.data[1].operations.data[0].data.fee.amount.data, 1)
+
+    def test_invalidate(self):
+        # changes to the list of a container are not seen, invalidate() drops the kept bytes after them
+        message = BlockMessage.unpack(Buffer(self.data))
+        operations = message.block.transactions.data[0].operations
+        operations.data.pop()
+        self.assertEqual(message.pack(), self.data)
+        operations.data[0].data.invalidate()
+        self.assertIsNone(message.raw)
+        self.assertEqual(len(BlockMessage.unpack(Buffer(message.pack())).block.transactions.data[0].operations.data),
+                         len(operations.data))
+
+    def test_pickled(self):
+        # unpickled values are linked to what they are nested in again
+        message = pickle.loads(pickle.dumps(BlockMessage.unpack(Buffer(self.data))))
+        self.assertEqual(message.pack(), self.data)
+        message.block.transactions.data[0].operations.data[0].data.fee.amount = 1
+        self.assertIsNone(message.raw)
+        self.assertNotEqual(message.pack(), self.data)
+
+    def test_raw_assignment(self):
+        message = BlockMessage.unpack(Buffer(self.data))
+        message.block_id = message.block_id
+        self.assertIsNone(message.raw)
+        trx = SignedBlock.unpack(Buffer(self.data)).transactions.data[0]
+        id_ = trx.id()
+        trx.raw = None
+        self.assertEqual(trx.id(), id_)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import asyncio
+import unittest
+
+from connection import PeerProtocol
+from fixtures import block_frames, decode_block
+from generic_types import Skipped
+from messages import BlockMessage, ItemID, frame_body, decode_message
+from pool import DecodePool
+
+
+class DecodePoolTest(unittest.TestCase):
+
+    def test_results_and_actions(self):
+        # actions get the messages with only their block ids decoded, on_result what the workers return, both in order
+        frames = block_frames(3, 4096)
+
+        async def run(pool):
+            done = asyncio.get_running_loop().create_future()
+            messages, results = [], []
+
+            def on_result(msg_type, result):
+                self.assertEqual(msg_type, BlockMessage.message_id)
+                results.append(result)
+                if len(results) == len(frames):
+                    done.set_result(None)
+
+            protocol = PeerProtocol(actions={BlockMessage.message_id: lambda msg, _: messages.append(msg)},
+                                    decode_pool=pool, on_result=on_result)
+            for frame in frames:
+                protocol.receive(frame)
+            await asyncio.wait_for(done, 60)
+            return messages, results
+
+        with DecodePool(decode_block, 1) as pool:
+            messages, results = asyncio.run(run(pool))
+        bodies = [frame_body(frame)[1] for frame in frames]
+        self.assertEqual([type(x) for x in messages], [BlockMessage] * len(frames))
+        self.assertEqual([type(x.block) for x in messages], [Skipped] * len(frames))
+        self.assertEqual([x.block_id.data for x in messages], [x[-ItemID.size:] for x in bodies])
+        self.assertEqual([x.pack() for x in messages], bodies)
+        self.assertEqual(results, [decode_block(decode_message(BlockMessage.message_id, x)) for x in bodies])
+
+    def test_needs_on_result(self):
+        async def run():
+            with DecodePool(decode_block, 1) as pool:
+                PeerProtocol(decode_pool=pool)
+        with self.assertRaises(ValueError):
+            asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
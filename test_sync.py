@@ -0,0 +1,56 @@
+import asyncio
+import multiprocessing
+import unittest
+
+from connection import connect
+from fixtures import mock_chain, block_id
+from messages import block_respond, blockchain_item_id_inventory_respond, item_not_available_respond
+from sync import BlockSync
+
+
+class BlockSyncTest(unittest.TestCase):
+    # syncs the blocks after block 1 from a mock chain, so one less than its head
+
+    def sync(self, head, **options):
+        port_queue = multiprocessing.Queue()
+        stop = multiprocessing.Event()
+        server = multiprocessing.Process(target=mock_chain, args=(port_queue, stop, head, 0.001, 0), kwargs=options)
+        server.start()
+        self.addCleanup(server.join)
+        self.addCleanup(stop.set)
+        port = port_queue.get()
+        sync = BlockSync(block_id(1), batch=20, timeout=0.5, retries=1)
+
+        async def run():
+            conn = await connect("127.0.0.1", port, sync=sync, actions={
+                1001: block_respond, 5002: blockchain_item_id_inventory_respond, 5005: item_not_available_respond})
+            sync.start(conn)
+            try:
+                return await asyncio.wait_for(sync.finished, 30)
+            finally:
+                conn.close()
+        return sync, asyncio.run(run())
+
+    def test_complete(self):
+        sync, blocks = self.sync(300)
+        self.assertEqual(blocks, 299)
+        self.assertEqual(sync.missing, [])
+
+    def test_unavailable(self):
+        # the block is requested once more, then given up on without holding up the rest
+        sync, blocks = self.sync(300, unavailable={150})
+        self.assertEqual(blocks, 298)
+        self.assertEqual(sync.missing, [block_id(150)])
+        self.assertEqual(sync.in_flight, 0)
+        self.assertEqual(sync.requested, {})
+
+    def test_dropped(self):
+        # the peer never sends the block, its batch times out
+        sync, blocks = self.sync(300, dropped={42, 43})
+        self.assertEqual(blocks, 297)
+        self.assertEqual(sync.missing, [block_id(42), block_id(43)])
+        self.assertEqual(sync.in_flight, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import json
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from fixtures import block_bytes
+from messages import BlockMessage
+from utils import Buffer
+
+
+class ThreadedDecodeTest(unittest.TestCase):
+    # blocks decoded from several threads at once come out as they do on one thread
+
+    def test_blocks(self):
+        data = [block_bytes(16 * 1024, 30000000 + i * 1000) for i in range(8)]
+        expected = [json.dumps(BlockMessage.unpack(Buffer(x)).json_object()) for x in data]
+
+        def decode(i):
+            block = BlockMessage.unpack(Buffer(data[i]))
+            # the lazy transactions are touched in a different order than json_object() does
+            for trx in reversed(block["block"]["transactions"].data):
+                trx.json_object()
+            return i, json.dumps(block.json_object())
+
+        for count in (2, 4, 8):
+            with ThreadPoolExecutor(count) as pool:
+                results = list(pool.map(decode, [i % len(data) for i in range(len(data) * count)]))
+            for i, res in results:
+                self.assertEqual(res, expected[i], "block %d decoded differently on %d threads" % (i, count))
+
+    def test_shared_block(self):
+        # threads touching the lazy transactions of the same block get the same values
+        data = block_bytes(64 * 1024)
+        expected = BlockMessage.unpack(Buffer(data)).block.json_object()
+        block = BlockMessage.unpack(Buffer(data)).block
+        transactions = block.transactions.data
+
+        def touch(step):
+            return [transactions[i].id().data for i in range(len(transactions))[::step]]
+
+        with ThreadPoolExecutor(4) as pool:
+            list(pool.map(touch, (1, -1, 2, -3)))
+        self.assertEqual(block.json_object(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,21 +1,187 @@
+from struct import Struct
+
+uint8 = Struct("<B")
+uint16 = Struct("<H")
+uint32 = Struct("<I")
+uint64 = Struct("<Q")
+int64 = Struct("<q")
+float64 = Struct("<d")
+
+
+# Varints are little endian groups of 7 bits, the high bit is set on every byte but the last.
+
+def decode_varint(buf, pos: int):
+    # returns the value and the position after it
+    byte = buf[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    value = byte & 0x7f
+    shift = 7
+    while True:
+        pos += 1
+        byte = buf[pos]
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos + 1
+        shift += 7
+
+
+def decode_varints(buf, pos: int, count: int):
+    # returns a list of count consecutive values and the position after them
+    res = []
+    append = res.append
+    for _ in range(count):
+        byte = buf[pos]
+        pos += 1
+        if byte < 0x80:
+            append(byte)
+            continue
+        value = byte & 0x7f
+        shift = 7
+        while True:
+            byte = buf[pos]
+            pos += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        append(value)
+    return res, pos
+
+
+def encode_varint_into(out: bytearray, value: int):
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
 
 class Buffer:
-    def __init__(self):
-        self._buffer = bytearray()
+    # Read cursor over a byte buffer. read() and peek() return memoryview slices instead of copies, consumed bytes
+    # are dropped only when the buffer gets compacted on write.
+
+    # compact once this many bytes have been consumed and they make up at least half of the buffer
+    compact_threshold = 65536
+
+    def __init__(self, data=b""):
+        self._buffer = data
+        self._view = memoryview(data)
+        self._pos = 0
 
     def write(self, data: bytes):
-        self._buffer.extend(data)
+        pos = self._pos
+        if pos == len(self._view):
+            self._set(bytearray(data))
+        elif pos >= self.compact_threshold and pos * 2 >= len(self._view):
+            storage = bytearray(self._view[pos:])
+            storage.extend(data)
+            self._set(storage)
+        else:
+            self._view.release()
+            try:
+                self._buffer.extend(data)
+            except (AttributeError, BufferError):
+                # read-only storage, or views handed out by read() still pin it: continue on a copy
+                storage = bytearray(memoryview(self._buffer)[pos:])
+                storage.extend(data)
+                self._buffer = storage
+                pos = 0
+            self._view = memoryview(self._buffer)
+            self._pos = pos
+
+    def _set(self, storage):
+        self._buffer = storage
+        self._view = memoryview(storage)
+        self._pos = 0
 
     def read(self, size: int):
-        data = self._buffer[:size]
-        self._buffer[:size] = b""
+        data = self._view[self._pos:self._pos + size]
+        self._pos += len(data)
         return data
 
     def peek(self, size: int):
-        return self._buffer[:size]
+        return self._view[self._pos:self._pos + size]
+
+    def skip(self, size: int):
+        if size > len(self._view) - self._pos:
+            raise IndexError("Cannot skip %d bytes, only %d left" % (size, len(self._view) - self._pos))
+        self._pos += size
+
+    def unpack(self, struct: Struct):
+        res = struct.unpack_from(self._view, self._pos)
+        self._pos += struct.size
+        return res
+
+    def read_uint8(self):
+        res = self._view[self._pos]
+        self._pos += 1
+        return res
+
+    def read_uint16(self):
+        res = uint16.unpack_from(self._view, self._pos)[0]
+        self._pos += 2
+        return res
+
+    def read_uint32(self):
+        res = uint32.unpack_from(self._view, self._pos)[0]
+        self._pos += 4
+        return res
+
+    def read_uint64(self):
+        res = uint64.unpack_from(self._view, self._pos)[0]
+        self._pos += 8
+        return res
+
+    def read_int64(self):
+        res = int64.unpack_from(self._view, self._pos)[0]
+        self._pos += 8
+        return res
+
+    def read_varint(self):
+        res, self._pos = decode_varint(self._view, self._pos)
+        return res
+
+    def read_varints(self, count: int):
+        res, self._pos = decode_varints(self._view, self._pos, count)
+        return res
 
     def count(self):
-        return len(self._buffer)
+        return len(self._view) - self._pos
 
     def __len__(self):
-        return len(self._buffer)
\ No newline at end of file
+        return len(self._view) - self._pos
+
+
+class Writer(bytearray):
+    # Output buffer for pack_into(). Values are appended through the bytearray C methods, so encoding a tree of
+    # values fills this one buffer instead of returning and concatenating a new bytearray per value.
+
+    write = bytearray.extend
+    write_uint8 = bytearray.append
+    tell = bytearray.__len__
+
+    def write_zeros(self, size: int):
+        self.extend(bytes(size))
+
+    def write_struct(self, struct: Struct, *values):
+        self.extend(struct.pack(*values))
+
+    def write_uint16(self, value: int):
+        self.extend(uint16.pack(value))
+
+    def write_uint32(self, value: int):
+        self.extend(uint32.pack(value))
+
+    def write_uint64(self, value: int):
+        self.extend(uint64.pack(value))
+
+    def write_int64(self, value: int):
+        self.extend(int64.pack(value))
+
+    write_varint = encode_varint_into
+
+    def patch(self, pos: int, struct: Struct, *values):
+        # overwrites already written bytes, e.g. a length header once the body is known
+        if pos + struct.size > len(self):
+            raise IndexError("Cannot patch %d bytes at %d, only %d written" % (struct.size, pos, len(self)))
+        struct.pack_into(self, pos, *values)